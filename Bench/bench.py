@@ -0,0 +1,294 @@
+import os, sys, argparse, json, time, gzip, shutil, tempfile, tracemalloc, gc, platform
+
+# Times the hot paths of CheckPCI and IOReg and measures their peak Python
+# memory use against synthetic small, medium, and huge fixtures.  Results
+# can be saved as a baseline, and later runs fail when they regress past
+# the allowed threshold.
+
+BENCH = os.path.dirname(os.path.realpath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0,ROOT)
+from CheckPCI import CheckPCI
+from Scripts import ioreg, plist
+import gen_dumps
+
+SIZES = {
+    "small":  {"roots":1,"depth":1,"bridges":2,"devices":4,"props":2,"vendors":250},
+    "medium": {"roots":2,"depth":3,"bridges":3,"devices":8,"props":8,"vendors":1000},
+    "huge":   {"roots":8,"depth":3,"bridges":4,"devices":24,"props":16,"vendors":4000}
+}
+SIZE_ORDER = ("small","medium","huge")
+BASELINE_VERSION = 1
+
+class Silence:
+    # Swallows anything printed while the benchmarked code runs
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull,"w")
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+class Bench:
+    def __init__(self, temp, repeat=5):
+        self.temp = temp
+        self.repeat = max(1,repeat)
+        self.benchmarks = (
+            ("get_all_devices",self.bench_get_all_devices),
+            ("get_all_devices_archive",self.bench_get_all_devices_archive),
+            ("get_pci_dict",self.bench_get_pci_dict),
+            ("_get_pci_ids_dict",self.bench_get_pci_ids_dict),
+            ("get_device_info_from_pci_ids",self.bench_get_device_info_from_pci_ids),
+            ("get_device_info_from_pci_ids_lazy",self.bench_get_device_info_from_pci_ids_lazy),
+            ("save_plist",self.bench_save_plist),
+            ("main",self.bench_main)
+        )
+
+    def _read_lines(self, path):
+        # Mirrors how CheckPCI._read_ioreg() splits a dump
+        with open(path,"rb") as f:
+            return f.read().replace(b"\x00",b"").decode(errors="ignore").strip().replace("\r","").split("\n")
+
+    def prepare(self, size):
+        # Builds the fixtures for the passed size in their own folder
+        opts = SIZES[size]
+        folder = os.path.join(self.temp,size)
+        os.makedirs(folder)
+        g = gen_dumps.Generator(
+            roots=opts["roots"],
+            depth=opts["depth"],
+            bridges=opts["bridges"],
+            devices=opts["devices"],
+            props=opts["props"]
+        )
+        fixture = {
+            "size":size,
+            "folder":folder,
+            "ioreg":os.path.join(folder,"ioreg.txt"),
+            "ps":os.path.join(folder,"ps.txt"),
+            "archive":os.path.join(folder,"ioreg.bplist"),
+            "pci_ids":os.path.join(folder,"pci.ids"),
+            "plist":os.path.join(folder,"devices.plist")
+        }
+        with open(fixture["ioreg"],"w") as f:
+            fixture["devices"] = g.write_ioreg(f)["devices"]
+        with open(fixture["archive"],"wb") as f:
+            g.write_ioreg_archive(f,binary=True)
+        with open(fixture["ps"],"w") as f:
+            g.write_ps(f)
+        with gzip.open(fixture["pci_ids"]+".gz","wt") as f:
+            gen_dumps.write_pci_ids(f,vendors=opts["vendors"])
+        fixture["ioreg_lines"] = self._read_lines(fixture["ioreg"])
+        fixture["ps_lines"] = self._read_lines(fixture["ps"])
+        with open(fixture["archive"],"rb") as f:
+            fixture["archive_root"] = plist.load(f)
+        # Build the compiled cache, and expand the pci.ids and build its
+        # index up front so the lookups below only measure the lookups
+        i = self.get_ioreg(fixture)
+        i._get_pci_ids_dict()
+        i._get_pci_ids_index()
+        i.ioreg["IOService"] = fixture["ioreg_lines"]
+        fixture["infos"] = [d.get("info",{}) for d in i.get_all_devices().values()]
+        return fixture
+
+    def get_ioreg(self, fixture):
+        # Points a fresh IOReg at the fixture's pci.ids rather than the
+        # one in Scripts
+        i = ioreg.IOReg()
+        i.pci_ids_path = fixture["pci_ids"]
+        i.pci_ids_cache_path = i.pci_ids_path+".cache"
+        i.pci_ids_validators_path = i.pci_ids_path+".validators"
+        i.pci_ids_index_path = i.pci_ids_path+".index"
+        i.pci_ids_expanded_path = i.pci_ids_path+".expanded"
+        return i
+
+    def get_checkpci(self, fixture):
+        c = CheckPCI()
+        c._i = self.get_ioreg(fixture)
+        return c
+
+    # Each bench_* function does its setup and returns the callable to
+    # measure - only the callable is timed
+
+    def bench_get_all_devices(self, fixture):
+        i = self.get_ioreg(fixture)
+        i.ioreg["IOService"] = fixture["ioreg_lines"]
+        return i.get_all_devices
+
+    def bench_get_all_devices_archive(self, fixture):
+        i = self.get_ioreg(fixture)
+        i.ioreg["IOService"] = fixture["archive_root"]
+        return i.get_all_devices
+
+    def bench_get_pci_dict(self, fixture):
+        c = self.get_checkpci(fixture)
+        return lambda: c.get_pci_dict(ps_output=fixture["ps_lines"])
+
+    def bench_get_pci_ids_dict(self, fixture):
+        # Drop the compiled cache so we time a full parse of the .gz
+        i = self.get_ioreg(fixture)
+        if os.path.exists(i.pci_ids_cache_path):
+            os.remove(i.pci_ids_cache_path)
+        return i._get_pci_ids_dict
+
+    def bench_get_device_info_from_pci_ids(self, fixture):
+        i = self.get_ioreg(fixture)
+        infos = fixture["infos"]
+        def run():
+            for info in infos:
+                i.get_device_info_from_pci_ids(info)
+        return run
+
+    def bench_get_device_info_from_pci_ids_lazy(self, fixture):
+        i = self.get_ioreg(fixture)
+        i.pci_ids_lazy = True
+        infos = fixture["infos"]
+        def run():
+            for info in infos:
+                i.get_device_info_from_pci_ids(info)
+        return run
+
+    def bench_save_plist(self, fixture):
+        c = self.get_checkpci(fixture)
+        def run():
+            with Silence():
+                c.save_plist(fixture["plist"],ioreg_override=fixture["ioreg"])
+        return run
+
+    def bench_main(self, fixture):
+        c = self.get_checkpci(fixture)
+        def run():
+            with Silence():
+                c.main(ioreg_override=fixture["ioreg"])
+        return run
+
+    def measure(self, setup, fixture):
+        times = []
+        for _ in range(self.repeat):
+            func = setup(fixture)
+            gc.collect()
+            # Keep the collector out of the timings like timeit does
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter()-start)
+            finally:
+                gc.enable()
+        # Peak memory gets its own run as tracemalloc slows things down
+        func = setup(fixture)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        times.sort()
+        return {
+            "min":round(times[0],6),
+            "median":round(times[len(times)//2],6),
+            "peak":peak
+        }
+
+    def run(self, sizes, names=None):
+        results = {}
+        for size in sizes:
+            fixture = self.prepare(size)
+            print("{} ({:,} devices)".format(size,fixture["devices"]))
+            results[size] = {}
+            for name,setup in self.benchmarks:
+                if names and not name in names:
+                    continue
+                r = results[size][name] = self.measure(setup,fixture)
+                print(" - {:<34} {:>10.2f}ms min {:>10.2f}ms median {:>10.1f}KiB peak".format(
+                    name,r["min"]*1000,r["median"]*1000,r["peak"]/1024.0
+                ))
+        return results
+
+def compare(results, baseline, threshold=0.25, mem_threshold=0.25, min_time=0.005, min_mem=65536):
+    # Returns a list of regressions versus the baseline.  Tiny absolute
+    # changes are ignored so timer noise on the small fixtures doesn't
+    # trip the gate.
+    regressions = []
+    for size,benches in results.items():
+        for name,r in benches.items():
+            b = baseline.get(size,{}).get(name)
+            if not b:
+                continue
+            if r["min"] > b["min"]*(1+threshold) and r["min"]-b["min"] > min_time:
+                regressions.append("{} {}: {:.2f}ms -> {:.2f}ms (+{:.0%})".format(
+                    size,name,b["min"]*1000,r["min"]*1000,r["min"]/b["min"]-1
+                ))
+            if r["peak"] > b["peak"]*(1+mem_threshold) and r["peak"]-b["peak"] > min_mem:
+                regressions.append("{} {}: {:.1f}KiB -> {:.1f}KiB peak (+{:.0%})".format(
+                    size,name,b["peak"]/1024.0,r["peak"]/1024.0,r["peak"]/float(b["peak"])-1
+                ))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="bench.py", description="Benchmarks CheckPCI's hot paths and gates on regressions versus a saved baseline.")
+    parser.add_argument("-s", "--sizes", help="comma delimited fixture sizes to run (default is small,medium,huge)",default=",".join(SIZE_ORDER))
+    parser.add_argument("-n", "--names", help="comma delimited benchmark names to run (default is all)")
+    parser.add_argument("-r", "--repeat", help="number of timed runs per benchmark (default is 5)",type=int,default=5)
+    parser.add_argument("-b", "--baseline", help="baseline json path (default is baseline.json next to this script)",default=os.path.join(BENCH,"baseline.json"))
+    parser.add_argument("-w", "--write-baseline", help="save the results as the new baseline instead of comparing",action="store_true")
+    parser.add_argument("-t", "--threshold", help="allowed fractional slowdown before failing (default is 0.25)",type=float,default=0.25)
+    parser.add_argument("-m", "--mem-threshold", help="allowed fractional peak memory growth before failing (default is 0.25)",type=float,default=0.25)
+    parser.add_argument("-j", "--json", help="also save this run's results as json to the provided path")
+    args = parser.parse_args()
+
+    sizes = [x.strip() for x in args.sizes.split(",") if x.strip()]
+    bad = [x for x in sizes if not x in SIZES]
+    if bad:
+        print("Unknown size{}: {}".format("" if len(bad)==1 else "s",", ".join(bad)))
+        exit(1)
+    names = [x.strip() for x in args.names.split(",")] if args.names else None
+    temp = tempfile.mkdtemp(prefix="checkpci-bench-")
+    try:
+        results = Bench(temp,repeat=args.repeat).run(sizes,names=names)
+    finally:
+        shutil.rmtree(temp,ignore_errors=True)
+    output = {
+        "version":BASELINE_VERSION,
+        "python":platform.python_version(),
+        "platform":platform.platform(),
+        "results":results
+    }
+    if args.json:
+        with open(args.json,"w") as f:
+            json.dump(output,f,indent=2)
+    if args.write_baseline:
+        if os.path.isfile(args.baseline):
+            # Keep any sizes/benchmarks we didn't run this time
+            try:
+                with open(args.baseline) as f:
+                    old = json.load(f)
+                if old.get("version") == BASELINE_VERSION:
+                    for size,benches in old.get("results",{}).items():
+                        for name,r in benches.items():
+                            results.setdefault(size,{}).setdefault(name,r)
+            except Exception as e:
+                print("Replacing unreadable baseline: {}".format(e))
+        with open(args.baseline,"w") as f:
+            json.dump(output,f,indent=2)
+        print("Saved baseline to '{}'".format(args.baseline))
+        exit()
+    if not os.path.isfile(args.baseline):
+        # Nothing to gate on - fail rather than pass without comparing
+        print("No baseline at '{}' - run with -w to save one".format(args.baseline))
+        exit(1)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION:
+        print("Baseline version mismatch - run with -w to replace it")
+        exit(1)
+    if baseline.get("python") != output["python"]:
+        print("Note: baseline was saved with Python {}".format(baseline.get("python")))
+    regressions = compare(results,baseline.get("results",{}),threshold=args.threshold,mem_threshold=args.mem_threshold)
+    if regressions:
+        print("Regressed versus '{}':".format(args.baseline))
+        for r in regressions:
+            print(" - "+r)
+        exit(1)
+    print("No regressions versus '{}'".format(args.baseline))
@@ -0,0 +1,405 @@
+import os, sys, argparse, random, json
+
+# Builds synthetic `ioreg -lw0` (or `ioreg -a -l`) and Powershell
+# InstanceId/KeyName/Data dumps of arbitrary size so CheckPCI can be
+# exercised against machines far larger than the ones we have on hand.
+# The same seed and options always produce the same topology for every
+# format.
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from Scripts import plist
+
+# (vendor, device, subsystem vendor, subsystem, class code, friendly name)
+BRIDGES = (
+    (0x8086,0xa2e7,0x1043,0x8694,0x060400,"Intel(R) 200 Series PCH PCI Express Root Port"),
+    (0x10b5,0x8747,0x10b5,0x8747,0x060400,"PLX Technology PEX 8747 PCI Express Switch"),
+    (0x1022,0x1483,0x1022,0x1453,0x060400,"AMD Starship/Matisse GPP Bridge")
+)
+ENDPOINTS = (
+    (0x144d,0xa808,0x144d,0xa801,0x010802,"Samsung NVMe SSD Controller SM981/PM981/PM983"),
+    (0x8086,0x1533,0x8086,0x0001,0x020000,"Intel(R) I210 Gigabit Network Connection"),
+    (0x1002,0x73df,0x1da2,0xe445,0x030000,"AMD Radeon RX 6700 XT"),
+    (0x1b21,0x2142,0x1043,0x8756,0x0c0330,"ASMedia USB 3.1 eXtensible Host Controller"),
+    (0x14e4,0x43a0,0x106b,0x0117,0x028000,"Broadcom BCM4360 802.11ac Wireless Network Adapter"),
+    (0x8086,0xa2f0,0x1043,0x8723,0x040300,"Intel(R) High Definition Audio Controller"),
+    (0x8086,0xa282,0x1043,0x8694,0x010601,"Intel(R) 200 Series PCH SATA controller [AHCI mode]")
+)
+PS_KEYS = (
+    "DEVPKEY_Device_Parent",
+    "DEVPKEY_NAME",
+    "DEVPKEY_Device_LocationPaths",
+    "DEVPKEY_PciDevice_BaseClass",
+    "DEVPKEY_PciDevice_SubClass",
+    "DEVPKEY_PciDevice_ProgIf",
+    "DEVPKEY_Device_Address",
+    "DEVPKEY_Device_LocationInfo"
+)
+
+class Generator:
+    def __init__(self, roots=1, depth=2, bridges=2, devices=4, props=0, prop_size=16, missing_acpi=0.25, seed=0):
+        self.roots = max(1,roots)
+        self.depth = max(0,depth)
+        self.bridges = max(0,bridges)
+        self.devices = max(0,devices)
+        self.props = max(0,props)
+        self.prop_size = max(1,prop_size)
+        self.missing_acpi = min(1.0,max(0.0,missing_acpi))
+        self.seed = seed
+        if self.bridges+self.devices > 256:
+            raise ValueError("Only 256 functions fit on a single bus")
+
+    def root_name(self, uid):
+        return "PC{:02X}".format(uid) if uid < 0x100 else "P{:03X}".format(uid)
+
+    def walk(self):
+        # Yields every root and device in depth-first order.  Each entry
+        # carries enough context for either writer to emit it in one
+        # pass - its tree depth, whether it's the last of its siblings,
+        # how many children it has, and its ACPI/PCI paths.
+        rng = random.Random(self.seed)
+        bus = [0]
+        for uid in range(self.roots):
+            root = self.root_name(uid)
+            children = self._bus_slots(1)
+            yield {
+                "kind":"root",
+                "uid":uid,
+                "name":root,
+                "last":uid == self.roots-1,
+                "children":children,
+                "depth":0,
+                "instance":"ACPI\\PNP0A08\\{}".format(uid)
+            }
+            for d in self._walk_bus(rng,bus,uid,1,"ACPI\\PNP0A08\\{}".format(uid),[],["ACPI(_SB_)","ACPI({})".format(root)],["/_SB/{}@{:x}".format(root,uid)],True):
+                yield d
+            bus[0] += 1
+
+    def _walk_bus(self, rng, bus, uid, depth, parent, pci_path, acpi_path, apple_path, built_in):
+        this_bus = bus[0]
+        # No more bridges past the deepest level
+        bridges = self.bridges if depth <= self.depth else 0
+        slots = bridges+self.devices
+        for i in range(slots):
+            bridge = i < bridges
+            # Spread functions across the device numbers first
+            dev,func = i % 32, i // 32
+            info = rng.choice(BRIDGES if bridge else ENDPOINTS)
+            rev = rng.randrange(0x100)
+            # Once a bridge is missing from ACPI, so is everything below it
+            has_acpi = built_in and rng.random() >= self.missing_acpi
+            pci = "PCI({:02X}{:02X})".format(dev,func)
+            if has_acpi:
+                acpi = ("RP{:02X}" if bridge else "D{:03X}").format(i)
+                _acpi_path = acpi_path+["ACPI({})".format(acpi.ljust(4,"_"))]
+                _apple_path = apple_path+["{}@{:x}".format(acpi,(dev<<16)+func)]
+            else:
+                acpi = None
+                _acpi_path = acpi_path+[pci]
+                _apple_path = None
+            instance = "PCI\\VEN_{:04X}&DEV_{:04X}&SUBSYS_{:04X}{:04X}&REV_{:02X}\\{}&{:X}&0&{:02X}".format(
+                info[0],info[1],info[3],info[2],rev,
+                3+depth,(uid<<24)+this_bus,(dev<<3)+func
+            )
+            yield {
+                "kind":"bridge" if bridge else "device",
+                "uid":uid,
+                "bus":this_bus,
+                "dev":dev,
+                "func":func,
+                "info":info,
+                "rev":rev,
+                "acpi":acpi,
+                "acpi_path":_acpi_path,
+                "apple_path":_apple_path,
+                "pci_path":pci_path+[pci],
+                "last":i == slots-1,
+                "children":self._bus_slots(depth+1) if bridge else 0,
+                "depth":depth,
+                "parent":parent,
+                "instance":instance
+            }
+            if bridge:
+                bus[0] += 1
+                for d in self._walk_bus(rng,bus,uid,depth+1,instance,pci_path+[pci],_acpi_path,_apple_path,has_acpi):
+                    yield d
+
+    def _bus_slots(self, depth):
+        return (self.bridges if depth <= self.depth else 0)+self.devices
+
+    def _le(self, value, length=4):
+        # Little-endian data as ioreg stores it
+        return bytes(bytearray((value >> (8*i)) & 0xFF for i in range(length)))
+
+    def _filler(self, rng):
+        return [("synthetic-{:03d}".format(i),rng.getrandbits(8*self.prop_size).to_bytes(self.prop_size,"big")) for i in range(self.props)]
+
+    def _ioreg_text(self, value):
+        # Renders a property value as ioreg -l shows it - tuples hold the
+        # strings of a null terminated string list data value
+        if isinstance(value,tuple):
+            return "<{}>".format(",".join('"{}"'.format(x) for x in value))
+        if isinstance(value,bytes):
+            return "<{}>".format("".join("{:02x}".format(x) for x in bytearray(value)))
+        return '"{}"'.format(value)
+
+    def _ioreg_value(self, value):
+        # Same as above, but as ioreg -a stores it
+        if isinstance(value,tuple):
+            return "".join(x+"\x00" for x in value).encode()
+        return value
+
+    def _ioreg_nodes(self, node):
+        # Walks the whole registry and calls node(parent, last, name, clss,
+        # id, props, has_children) for each entry in order - whatever it
+        # returns is passed back as the parent of that entry's children
+        counts = {"nodes":0,"devices":0}
+        ids = [0x100000100]
+        # Filler data gets its own rng so it never shifts the topology
+        filler_rng = random.Random(self.seed)
+        def add(parent, last, name, clss, props, has_children):
+            counts["nodes"] += 1
+            ids[0] += 1
+            return node(parent,last,name,clss,ids[0],props,has_children)
+        top = add(None,True,"Root","IORegistryEntry",[("IOKitBuildVersion","Darwin Kernel Version 23.0.0")],True)
+        top = add(top,True,"MacPro7,1","IOPlatformExpertDevice",[("compatible",("MacPro7,1",)),("model",("MacPro7,1",))],True)
+        acpi = add(top,False,"AppleACPIPlatformExpert","AppleACPIPlatformExpert",[("IOClass","AppleACPIPlatformExpert")],True)
+        add(acpi,False,"CPU0@0","IOACPIPlatformDevice",[("name",("ACPI0007",)),("_UID","0")],False)
+        # Keep the parent of the devices on each bus by depth
+        bus_parent = {}
+        for d in self.walk():
+            if d["kind"] == "root":
+                child = add(acpi,d["last"],"{}@{:x}".format(d["name"],d["uid"]),"IOACPIPlatformDevice",[
+                    ("compatible",("PNP0A03",)),
+                    ("_UID","{}".format(d["uid"])),
+                    ("name",("PNP0A08",))
+                ],True)
+                bus_parent[1] = add(child,True,"AppleACPIPCI","AppleACPIPCI",[("IOClass","AppleACPIPCI")],d["children"] > 0)
+                continue
+            counts["devices"] += 1
+            ven,dev,subven,sub,cc,_ = d["info"]
+            addr = "{:x}".format(d["dev"]) if not d["func"] else "{:x},{:x}".format(d["dev"],d["func"])
+            name = "{}@{}".format(d["acpi"] or "pci{:x},{:x}".format(ven,dev),addr)
+            props = [
+                ("vendor-id",self._le(ven)),
+                ("device-id",self._le(dev)),
+                ("subsystem-vendor-id",self._le(subven)),
+                ("subsystem-id",self._le(sub)),
+                ("revision-id",self._le(d["rev"])),
+                ("class-code",self._le(cc)),
+                ("IOName","pci{:x},{:x}".format(ven,dev)),
+                ("name",("pci{:x},{:x}".format(ven,dev),)),
+                ("compatible",("pci{:x},{:x}".format(subven,sub),"pci{:x},{:x}".format(ven,dev),"pciclass,{:06x}".format(cc))),
+                ("pcidebug","{}:{}:{}".format(d["bus"],d["dev"],d["func"]))
+            ]
+            if d["apple_path"]:
+                props.append(("acpi-path","IOACPIPlane:{}".format("/".join(d["apple_path"]))))
+            props.extend(self._filler(filler_rng))
+            parent = bus_parent[d["depth"]]
+            if d["kind"] == "bridge":
+                child = add(parent,d["last"],name,"IOPCIDevice",props,True)
+                bus_parent[d["depth"]+1] = add(child,True,"IOPP","IOPCI2PCIBridge",[("IOClass","IOPCI2PCIBridge")],d["children"] > 0)
+            else:
+                child = add(parent,d["last"],name,"IOPCIDevice",props,True)
+                add(child,True,"AppleSyntheticDriver","AppleSyntheticDriver",[("IOClass","AppleSyntheticDriver")],False)
+        add(top,True,"IOResources","IOResources",[("IOKit","IOService")],False)
+        return counts
+
+    def write_ioreg(self, f):
+        def node(prefix, last, name, clss, _id, props, has_children):
+            prefix = prefix or ""
+            f.write("{}+-o {}  <class {}, id 0x{:x}, registered, matched, active, busy 0 (0 ms), retain 9>\n".format(prefix,name,clss,_id))
+            child = prefix+("  " if last else "| ")
+            bar = child+("| " if has_children else "  ")
+            f.write(bar+"{\n")
+            for k,v in props:
+                f.write(bar+'  "{}" = {}\n'.format(k,self._ioreg_text(v)))
+            f.write(bar+"}\n")
+            f.write(bar+"\n")
+            return child
+        return self._ioreg_nodes(node)
+
+    def write_ioreg_archive(self, f, binary=False):
+        # Mirrors ioreg -a -l - the same registry as write_ioreg() as an
+        # XML (or binary) plist of nested IORegistryEntryChildren.  f must
+        # be opened in binary mode.
+        root = []
+        def node(parent, last, name, clss, _id, props, has_children):
+            entry = {
+                "IORegistryEntryName":name.split("@")[0],
+                "IORegistryEntryID":_id,
+                "IOObjectClass":clss,
+                "IOObjectRetainCount":9
+            }
+            if "@" in name:
+                entry["IORegistryEntryLocation"] = name.split("@")[1]
+            for k,v in props:
+                entry[k] = self._ioreg_value(v)
+            if has_children:
+                entry["IORegistryEntryChildren"] = []
+            if parent is None:
+                root.append(entry)
+            else:
+                parent["IORegistryEntryChildren"].append(entry)
+            return entry
+        counts = self._ioreg_nodes(node)
+        plist.dump(root[0],f,fmt=plist.FMT_BINARY if binary else plist.FMT_XML)
+        return counts
+
+    def _ps_rows(self):
+        # Yields (InstanceId, KeyName, Data) with Data typed the way
+        # ConvertTo-Json sees it - location paths are lists, and the
+        # class and address values are numbers
+        for d in self.walk():
+            if d["kind"] == "root":
+                yield (d["instance"],"DEVPKEY_Device_Parent","ACPI_HAL\\PNP0C08\\0")
+                yield (d["instance"],"DEVPKEY_NAME","PCI Express Root Complex")
+                yield (d["instance"],"DEVPKEY_Device_LocationPaths",["ACPI(_SB_)#ACPI({})".format(d["name"])])
+                yield (d["instance"],"DEVPKEY_Device_Address",d["uid"])
+                continue
+            ven,dev,subven,sub,cc,friendly = d["info"]
+            values = (
+                d["parent"],
+                friendly,
+                ["PCIROOT({:X})#{}".format(d["uid"],"#".join(d["pci_path"])),"#".join(d["acpi_path"])],
+                cc >> 16,
+                (cc >> 8) & 0xFF,
+                cc & 0xFF,
+                (d["dev"]<<16)+d["func"],
+                "PCI bus {}, device {}, function {}".format(d["bus"],d["dev"],d["func"])
+            )
+            for key,value in zip(PS_KEYS,values):
+                yield (d["instance"],key,value)
+
+    def _ps_text(self, value):
+        # Format-Table shows lists as {A, B}
+        if isinstance(value,list):
+            return "{{{}}}".format(", ".join(value))
+        return str(value)
+
+    def write_ps(self, f):
+        # Format-Table -Autosize pads each column to its widest value, so
+        # walk once to size the InstanceId column, then again to write
+        id_width = max(len("InstanceId"),max(len(r[0]) for r in self._ps_rows()))
+        key_width = max(len(k) for k in PS_KEYS)
+        counts = {"rows":0,"devices":0}
+        f.write("\n")
+        f.write("{} {} Data\n".format("InstanceId".ljust(id_width),"KeyName".ljust(key_width)))
+        f.write("{} {} ----\n".format("----------".ljust(id_width),"-------".ljust(key_width)))
+        last = None
+        for instance,key,value in self._ps_rows():
+            counts["rows"] += 1
+            if instance != last and instance.startswith("PCI\\"):
+                counts["devices"] += 1
+            last = instance
+            f.write("{} {} {}\n".format(instance.ljust(id_width),key.ljust(key_width),self._ps_text(value)))
+        f.write("\n")
+        return counts
+
+    def write_ps_json(self, f):
+        # Mirrors Select -Property InstanceId,KeyName,Data|ConvertTo-Json -Compress
+        counts = {"rows":0,"devices":0}
+        last = None
+        f.write("[")
+        for instance,key,value in self._ps_rows():
+            if counts["rows"]:
+                f.write(",")
+            counts["rows"] += 1
+            if instance != last and instance.startswith("PCI\\"):
+                counts["devices"] += 1
+            last = instance
+            f.write(json.dumps({"InstanceId":instance,"KeyName":key,"Data":value},separators=(",",":")))
+        f.write("]\n")
+        return counts
+
+def write_pci_ids(f, vendors=2500, seed=0):
+    # Builds a pci.ids in the upstream layout with every vendor, device,
+    # and subsystem the Generator uses, padded out with random vendors
+    rng = random.Random(seed)
+    known = {}
+    for ven,dev,subven,sub,cc,name in BRIDGES+ENDPOINTS:
+        known.setdefault(ven,{})[dev] = (name,subven,sub)
+    ids = set(known)
+    while len(ids) < vendors:
+        ids.add(rng.randrange(0x1000,0xffff))
+    counts = {"vendors":0,"devices":0,"lines":0}
+    def write(line):
+        counts["lines"] += 1
+        f.write(line+"\n")
+    for line in ("#","#\tList of PCI ID's","#","# Vendors, devices and subsystems. Please keep sorted.",""):
+        write(line)
+    for ven in sorted(ids):
+        counts["vendors"] += 1
+        write("{:04x}  Synthetic Vendor {:04X}".format(ven,ven))
+        devs = dict((d,("Synthetic Device {:04X}".format(d),None,None)) for d in (rng.randrange(0x10000) for _ in range(rng.randrange(25))))
+        devs.update(known.get(ven,{}))
+        for dev in sorted(devs):
+            counts["devices"] += 1
+            name,subven,sub = devs[dev]
+            write("\t{:04x}  {}".format(dev,name))
+            if subven is not None:
+                write("\t\t{:04x} {:04x}  {} (Synthetic Subsystem)".format(subven,sub,name))
+            for _ in range(rng.randrange(3)):
+                write("\t\t{:04x} {:04x}  Synthetic Subsystem".format(rng.randrange(0x10000),rng.randrange(0x10000)))
+    write("")
+    write("# List of known device classes, subclasses and programming interfaces")
+    write("")
+    classes = {}
+    for x in BRIDGES+ENDPOINTS:
+        classes.setdefault(x[4] >> 16,{}).setdefault((x[4] >> 8) & 0xFF,set()).add(x[4] & 0xFF)
+    for c in sorted(classes):
+        write("C {:02x}  Synthetic Class {:02X}".format(c,c))
+        for sc in sorted(classes[c]):
+            write("\t{:02x}  Synthetic Subclass {:02X}".format(sc,sc))
+            for pi in sorted(classes[c][sc]):
+                write("\t\t{:02x}  Synthetic ProgIf {:02X}".format(pi,pi))
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="gen_dumps.py", description="Builds synthetic ioreg -lw0, ioreg -a, Powershell Format-Table or JSON dumps (or a matching pci.ids) for CheckPCI scale testing.")
+    parser.add_argument("-t", "--type", help="dump type to build - plist and bplist are ioreg -a archives (default is ioreg)",choices=("ioreg","plist","bplist","ps","json","pciids"),default="ioreg")
+    parser.add_argument("-o", "--output-file", help="path to save the dump to (default is stdout)")
+    parser.add_argument("-r", "--roots", help="number of PciRoots (default is 1)",type=int,default=1)
+    parser.add_argument("-d", "--depth", help="levels of PCI bridges below each root (default is 2)",type=int,default=2)
+    parser.add_argument("-b", "--bridges", help="bridges per bus, except at the deepest level (default is 2)",type=int,default=2)
+    parser.add_argument("-n", "--devices", help="endpoint devices per bus (default is 4)",type=int,default=4)
+    parser.add_argument("-p", "--props", help="extra properties per ioreg device block (default is 0)",type=int,default=0)
+    parser.add_argument("-s", "--prop-size", help="bytes of data in each extra property (default is 16)",type=int,default=16)
+    parser.add_argument("-m", "--missing-acpi", help="ratio (0-1) of devices and bridges left out of ACPI (default is 0.25)",type=float,default=0.25)
+    parser.add_argument("-v", "--vendors", help="number of vendors to include with -t pciids (default is 2500)",type=int,default=2500)
+    parser.add_argument("--seed", help="random seed (default is 0)",type=int,default=0)
+    args = parser.parse_args()
+
+    try:
+        g = Generator(
+            roots=args.roots,
+            depth=args.depth,
+            bridges=args.bridges,
+            devices=args.devices,
+            props=args.props,
+            prop_size=args.prop_size,
+            missing_acpi=args.missing_acpi,
+            seed=args.seed
+        )
+    except ValueError as e:
+        print(e)
+        exit(1)
+    binary = args.type in ("plist","bplist")
+    if args.output_file:
+        f = open(args.output_file,"wb" if binary else "w")
+    else:
+        f = sys.stdout.buffer if binary else sys.stdout
+    try:
+        if binary:
+            counts = g.write_ioreg_archive(f,binary=args.type=="bplist")
+        elif args.type == "pciids":
+            counts = write_pci_ids(f,vendors=args.vendors,seed=args.seed)
+        elif args.type == "ps":
+            counts = g.write_ps(f)
+        elif args.type == "json":
+            counts = g.write_ps_json(f)
+        else:
+            counts = g.write_ioreg(f)
+    finally:
+        if args.output_file:
+            f.close()
+    sys.stderr.write("Built {}\n".format(", ".join("{:,} {}".format(v,k) for k,v in sorted(counts.items()))))
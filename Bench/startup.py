@@ -0,0 +1,91 @@
+import os, sys, argparse, subprocess, time, json
+
+# Measures how long CheckPCI.py takes to get going for a handful of CLI
+# paths.  Each case is run once with -X importtime to see which modules
+# were pulled in, then several more times for wall-clock timing.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CHECKPCI = os.path.join(ROOT,"CheckPCI.py")
+
+def get_cases(dump=None):
+    cases = [
+        # Parses the args and prints help
+        ("help",["-h"]),
+        # Builds the CheckPCI object, then bails on bad column info
+        ("bad-columns",["-c","0"])
+    ]
+    if dump:
+        # Reads a local ioreg/powershell dump end-to-end
+        cases.append(("local-ioreg",["-i",os.path.abspath(dump)]))
+    return cases
+
+def run_case(args, importtime=False):
+    comm = [sys.executable]
+    if importtime:
+        comm += ["-X","importtime"]
+    comm += [CHECKPCI]+args
+    start = time.perf_counter()
+    p = subprocess.Popen(comm,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+    err = p.communicate()[1]
+    return (time.perf_counter()-start,err.decode(errors="ignore"))
+
+def parse_importtime(output):
+    # Lines look like:
+    # import time: self [us] | cumulative | imported package
+    # import time:       262 |       7395 |   Scripts.run
+    modules = []
+    for line in output.split("\n"):
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _self,cumulative,name = line[len("import time:"):].split("|")
+            modules.append({
+                "name":name.strip(),
+                "self_us":int(_self),
+                "cumulative_us":int(cumulative)
+            })
+        except ValueError:
+            pass # Header line
+    return modules
+
+def bench(cases, runs=10, top=5):
+    results = []
+    for name,args in cases:
+        _,err = run_case(args,importtime=True)
+        modules = parse_importtime(err)
+        times = sorted(run_case(args)[0] for _ in range(runs))
+        results.append({
+            "case":name,
+            "args":args,
+            "runs":runs,
+            "min_ms":round(times[0]*1000,2),
+            "median_ms":round(times[len(times)//2]*1000,2),
+            "modules":len(modules),
+            "import_us":sum(m["self_us"] for m in modules),
+            "scripts":sorted(m["name"] for m in modules if m["name"].startswith("Scripts.")),
+            "slowest":sorted(modules,key=lambda x:x["self_us"],reverse=True)[:top]
+        })
+    return results
+
+def print_results(results):
+    for r in results:
+        print("{} ({})".format(r["case"]," ".join(r["args"])))
+        print(" - wall: {:.2f}ms min, {:.2f}ms median over {:,} runs".format(r["min_ms"],r["median_ms"],r["runs"]))
+        print(" - imports: {:,} modules in {:.2f}ms".format(r["modules"],r["import_us"]/1000.0))
+        print(" - Scripts modules: {}".format(", ".join(r["scripts"]) or "None"))
+        for m in r["slowest"]:
+            print("   {:>8.2f}ms {}".format(m["self_us"]/1000.0,m["name"]))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="startup.py", description="Times CheckPCI.py start-up for a few CLI paths.")
+    parser.add_argument("-i", "--local-ioreg", help="local ioreg/powershell dump to also time the -i path with")
+    parser.add_argument("-r", "--runs", help="number of timed runs per case (default is 10)",type=int,default=10)
+    parser.add_argument("-t", "--top", help="number of slowest imports to list per case (default is 5)",type=int,default=5)
+    parser.add_argument("-j", "--json", help="save the results as json to the provided path")
+    args = parser.parse_args()
+
+    results = bench(get_cases(args.local_ioreg),runs=max(1,args.runs),top=args.top)
+    print_results(results)
+    if args.json:
+        with open(args.json,"w") as f:
+            json.dump(results,f,indent=2)
@@ -1,21 +1,97 @@
-import os, sys, binascii, argparse, re
-from Scripts import ioreg, utils, run, plist
-if os.name == "nt":
-    # Only try to import on Windows
-    try:
-        from Scripts import winpci
-    except (ImportError, AttributeError):
-        pass
+import os, sys, binascii, argparse, re, codecs, itertools
+
+class PCIDevice:
+    # Compact record built by CheckPCI.get_ioreg_entries() and
+    # get_ps_entries() - one per listed device
+    __slots__ = (
+        "name",          # ACPI name without the address, or ""
+        "pcidebug",      # BB:DD.F formatted the way gfxutil does, or None
+        "vendor_id",     # Vendor id as an int, or None
+        "device_id",     # Device id as an int, or None
+        "built_in",      # True/False if the path is/isn't all in ACPI, or None
+        "acpi_path",     # ACPI path, or None
+        "device_path",   # PciRoot()/Pci() device path, or None
+        "friendly_name", # Only set when names were requested
+        "info"           # Raw properties, or None if they weren't kept
+    )
+
+    def __init__(self, name="", pcidebug=None, vendor_id=None, device_id=None, built_in=None, acpi_path=None, device_path=None, info=None):
+        self.name = name
+        self.pcidebug = pcidebug
+        self.vendor_id = vendor_id
+        self.device_id = device_id
+        self.built_in = built_in
+        self.acpi_path = acpi_path
+        self.device_path = device_path
+        self.friendly_name = None
+        self.info = info
+
+    def column(self, index):
+        # Returns the display value of a single column, or None if it's
+        # out of range
+        if index == 0:
+            return self.format_column(0,self.pcidebug)
+        if index == 1:
+            return self.format_column(1,(self.vendor_id,self.device_id))
+        if index == 2:
+            return self.format_column(2,self.built_in)
+        if index == 3:
+            return self.format_column(3,self.acpi_path)
+        if index == 4:
+            return self.format_column(4,self.device_path)
+        if index == 5:
+            return self.format_column(5,self.friendly_name)
+        return None
+
+    @staticmethod
+    def format_column(index, value):
+        # Formats the passed field value the way the column at the index
+        # displays it - the ids column takes a (vendor_id,device_id) tuple
+        if index == 0:
+            return value or "??:??.?"
+        if index == 1:
+            return "{}:{}".format(*("????" if x is None else "{:04x}".format(x) for x in value))
+        if index == 2:
+            return "???" if value is None else "YES" if value else "NO"
+        if index == 3:
+            return value or "Unknown ACPI Path"
+        if index == 4:
+            return value or "Unknown Device Path"
+        if index == 5:
+            return value
+        return None
+
+    @property
+    def row(self):
+        # The display values in column order
+        row = [self.column(i) for i in range(5)]
+        if self.friendly_name is not None:
+            row.append(self.friendly_name)
+        return row
+
+    def __repr__(self):
+        return "<PCIDevice {} ({})>".format(self.name,self.device_path)
+
+class _Descending:
+    # Flips the ordering of the wrapped sort value
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
 
 class CheckPCI:
     def __init__(self):
-        # Verify running OS
-        if not sys.platform.lower() == "darwin" and not os.name == "nt":
-            print("This script can only be run on macOS or Windows!")
-            exit(1)
-        self.u = utils.Utils("CheckPCI")
-        self.i = ioreg.IOReg()
-        self.r = run.Run()
+        # The helpers below are only imported and built when first
+        # accessed - so paths like -h don't pay for what they don't use
+        self._u = None
+        self._i = None
+        self._r = None
         self.b_d_f_re = re.compile(r"^[^\d]*(?P<bus>\d+)[^\d]+(?P<device>\d+)[^\d]+(?P<function>\d+)[^\d]*$")
         self.default_columns = [
             ("PCIDBG",7),
@@ -24,6 +100,55 @@ class CheckPCI:
             ("ACPI",0),
             ("Device",0)
         ]
+        # The FriendlyName column is appended after the defaults with -n
+        self.name_column = len(self.default_columns)
+        # PCIDevice fields written by the json, ndjson, and csv output
+        # formats - along with the column index each belongs to
+        self.output_fields = [
+            ("name",None),
+            ("pcidebug",0),
+            ("vendor_id",1),
+            ("device_id",1),
+            ("built_in",2),
+            ("acpi_path",3),
+            ("device_path",4),
+            ("friendly_name",self.name_column)
+        ]
+        self.output_formats = ("table","json","ndjson","csv")
+        # Structured keys the rows can be sorted on - each maps to a
+        # _sort_<key>() function.  Rows missing the value sort last.
+        self.sort_keys = [
+            ("bdf","numeric bus, device, and function"),
+            ("ids","numeric vendor and device ids"),
+            ("acpi","ACPI path"),
+            ("path","numeric device path components"),
+            ("depth","device path depth"),
+            ("name","device name"),
+            ("builtin","devices that aren't built-in first")
+        ]
+        # Used when --limit is passed without a sort order
+        self.default_sort = ["bdf","path"]
+
+    @property
+    def u(self):
+        if self._u is None:
+            from Scripts import utils
+            self._u = utils.Utils("CheckPCI")
+        return self._u
+
+    @property
+    def i(self):
+        if self._i is None:
+            from Scripts import ioreg
+            self._i = ioreg.IOReg()
+        return self._i
+
+    @property
+    def r(self):
+        if self._r is None:
+            from Scripts import run
+            self._r = run.Run()
+        return self._r
 
     def hexy(self, integer,pad_to=0):
         return "0x"+hex(integer)[2:].upper().rjust(pad_to,"0")
@@ -106,10 +231,19 @@ class CheckPCI:
         # Return the resulting path
         return ".".join(acpi_comps)
 
+    def check_local_os(self):
+        # Gathering info from the current machine is only possible on
+        # macOS or Windows - local dumps can be read anywhere
+        if not sys.platform.lower() == "darwin" and not os.name == "nt":
+            print("This script can only be run on macOS or Windows!")
+            exit(1)
+
     def get_local_info(self):
+        self.check_local_os()
         if os.name == "nt":
             # Use our wrapper first
             try:
+                from Scripts import winpci
                 pci = winpci.get_pci_devices()
                 assert pci
                 return pci.split("\n")
@@ -129,6 +263,87 @@ class CheckPCI:
         else:
             return self.i.get_ioreg(plane="IODeviceTree")
 
+    def _get_location_paths(self, val):
+        # JSON captures keep DEVPKEY_Device_LocationPaths as a list, while
+        # Format-Table shows it as {PATH1, PATH2}
+        if isinstance(val,(list,tuple)):
+            return list(val)
+        return val.lstrip("{").rstrip("}").split(", ")
+
+    def _iter_ps_records(self, lines):
+        # Yields (instance_id, [(key, value), ...]) for each device in a
+        # powershell dump.  Accepts the lines of a Format-Table'd or
+        # ConvertTo-Json'd dump, or the already parsed JSON objects.
+        lines = iter(lines)
+        first = next(lines,None)
+        while first is not None and not isinstance(first,dict) and not first.strip():
+            first = next(lines,None)
+        if first is None:
+            return
+        lines = itertools.chain([first],lines)
+        if isinstance(first,dict):
+            records = self._iter_ps_json_records(lines)
+        elif first.lstrip().startswith(("[","{")):
+            # ConvertTo-Json output - a lone object isn't wrapped in a list
+            import json
+            data = json.loads("\n".join(lines))
+            records = self._iter_ps_json_records(data if isinstance(data,list) else [data])
+        else:
+            records = self._iter_ps_text_records(lines)
+        for record in records:
+            yield record
+
+    def _iter_ps_json_records(self, items):
+        # Maps InstanceId/KeyName/Data objects straight to records, keeping
+        # the Data values as-is
+        dev = None
+        props = []
+        for item in items:
+            if not isinstance(item,dict):
+                continue
+            try:
+                # The legacy WMI approach uses DeviceID
+                _dev = item.get("InstanceId",item.get("DeviceID")).upper()
+            except:
+                continue
+            key = item.get("KeyName")
+            if not key or not _dev.startswith(("PCI\\","ACPI\\")):
+                continue # No data here
+            if _dev != dev:
+                if props:
+                    yield (dev,props)
+                dev,props = _dev,[]
+            val = item.get("Data")
+            # Format-Table shows nulls as empty values
+            props.append((key,"" if val is None else val))
+        if props:
+            yield (dev,props)
+
+    def _iter_ps_text_records(self, lines):
+        # Groups the rows of a Format-Table'd InstanceId/KeyName/Data dump
+        # by device.  Each line is tokenized once, and each device's
+        # (instance_id, [(key, value), ...]) is yielded as soon as the
+        # next device's rows begin - so lines can be streamed from a file.
+        dev = None
+        props = []
+        for l in lines:
+            l = l.lstrip()
+            if not l.startswith(("PCI\\","ACPI\\")):
+                continue # No data here
+            # Only split off the first two columns - the value keeps any
+            # inner spaces, and loses the -width 9999 padding on the right
+            parts = l.split(None,2)
+            if len(parts) < 2:
+                continue # Truncated
+            _dev = parts[0].upper()
+            if _dev != dev:
+                if props:
+                    yield (dev,props)
+                dev,props = _dev,[]
+            props.append((parts[1],parts[2].rstrip() if len(parts) > 2 else ""))
+        if props:
+            yield (dev,props)
+
     def get_pci_dict(self, ps_output=None):
         # Attempt to run a powershell one-liner to get a list of all
         # instance ids which start with PCI
@@ -138,180 +353,178 @@ class CheckPCI:
         if not ps_output:
             return None
         # Walk the devices and their subsequent paths
-        dev = None
         dev_dict = {}
         pci_dict = {}
-        for l in ps_output:
-            if not l.strip().startswith(("PCI\\","ACPI\\")):
-                continue # No data here
-            dev = l.split()[0].upper().strip()
-            key = l.split()[1].strip()
-            val = " ".join(l.split()[2:]).strip()
-            if dev.startswith("ACPI\\"):
-                # Got a PCI bus or root complex
-                if not dev in pci_dict:
-                    pci_dict[dev] = {}
-                # See if we got a path - or an address
+        for dev,props in self._iter_ps_records(ps_output):
+            for key,val in props:
+                if dev.startswith("ACPI\\"):
+                    # Got a PCI bus or root complex
+                    if not dev in pci_dict:
+                        pci_dict[dev] = {}
+                    # See if we got a path - or an address
+                    if key == "DEVPKEY_Device_LocationPaths":
+                        # ACPI address - get the path/name
+                        try:
+                            acpi = self._get_location_paths(val)[-1].split("#")[-1]
+                            if not acpi.startswith("ACPI("):
+                                continue # Botched value
+                            pci_dict[dev]["acpi_path"] = pci_dict[dev]["acpi_name"] = acpi.split("(")[1].split(")")[0]
+                        except:
+                            pass
+                    elif key == "DEVPKEY_Device_Parent":
+                        # We should be able to scrape the address from the 
+                        # parent path.  Formatted like: ACPI_HAL\PNP0C08\0
+                        try:
+                            pci_dict[dev]["address"] = hex(int(val.strip().split("\\")[-1]))[2:].upper()
+                        except:
+                            pass
+                    elif key == "DEVPKEY_Device_Address":
+                        # Try to convert it to a number
+                        try:
+                            pci_dict[dev]["address"] = hex(int(val))[2:].upper()
+                            if not pci_dict[dev].get("acpi_path"):
+                                # Set a pci-root/bus placeholder
+                                name = "pci-root@" if "PNP0A08" in dev else "pci-bus@"
+                                pci_dict[dev]["acpi_path"] = name+pci_dict[dev]["address"]
+                        except:
+                            pass
+                    # Check if we have the acpi_path, name, and address, and
+                    # ensure the path reflects that
+                    if all(x in pci_dict[dev] for x in ("acpi_path","acpi_name","address")):
+                        pci_dict[dev]["acpi_path"] = "{}@{}".format(
+                            pci_dict[dev]["acpi_path"].split("@")[0],
+                            pci_dict[dev]["address"]
+                        )
+                    continue # Skip PCI checks
+                # We must have a PCI entry
+                if not dev in dev_dict:
+                    # Initialize the device if needed
+                    dev_dict[dev] = {}
                 if key == "DEVPKEY_Device_LocationPaths":
-                    # ACPI address - get the path/name
+                    # Got the location paths
                     try:
-                        acpi = val.lstrip("{").rstrip("}").split(", ")[-1].split("#")[-1]
-                        if not acpi.startswith("ACPI("):
-                            continue # Botched value
-                        pci_dict[dev]["acpi_path"] = pci_dict[dev]["acpi_name"] = acpi.split("(")[1].split(")")[0]
+                        paths = self._get_location_paths(val)
+                        dev_path = next((p for p in paths if p.startswith("PCIROOT(")),"")
+                        acpi_path = next((p for p in paths if p.startswith("ACPI(")),"")
+                        # Only check built_in if we have an ACPI path
+                        built_in = "???"
+                        if acpi_path:
+                            built_in = "YES" if all(x.startswith("ACPI(") for x in acpi_path.split("#")) else "NO"
+                        else:
+                            # Mirror the PCI path under _SB_ if no
+                            # ACPI path was located
+                            acpi_path = "ACPI(_SB_)#"+dev_path
+                        try: ven_id = dev.split("VEN_")[1][:4].lower()
+                        except: ven_id = "????"
+                        try: dev_dict[dev]["vendor-id"] = int(ven_id,16)
+                        except: pass
+                        try: dev_id = dev.split("DEV_")[1][:4].lower()
+                        except: dev_id = "????"
+                        try: dev_dict[dev]["device-id"] = int(dev_id,16)
+                        except: pass
+                        try:
+                            subvensys_id = dev.split("SUBSYS_")[1][:8].lower()
+                            dev_dict[dev]["subsystem-vendor-id"] = int(subvensys_id[:4],16)
+                            dev_dict[dev]["subsystem-id"] = int(subvensys_id[4:],16)
+                        except:
+                            pass
+                        dev_name = None
+                        if acpi_path.split("#")[-1].startswith("ACPI("):
+                            dev_name = acpi_path.split("ACPI(")[-1].split(")")[0].rstrip("_")
+                        dev_paths = self.sanitize_device_path(dev_path)
+                        if not dev_paths:
+                            dev_paths = ("Unknown Device Path","Unknown Device Path")
+                        acpi_formatted = self.format_acpi_path(acpi_path)
+                        # Let's reformat the ACPI path - if any, skip the 
+                        # first entry as it isn't considered in gfxutil (i.e. _SB)
+                        if acpi_formatted:
+                            # Make sure to prefix our path with /
+                            acpi_parts = [a.rstrip("_") for a in acpi_formatted.split(".")[1:]]
+                            # Get our addresses from the PCI() elements
+                            pci_parts = dev_path.split("#")
+                            if len(pci_parts) == len(acpi_parts):
+                                # Walk the pci parts and keep track of the addressing
+                                for i,part in enumerate(pci_parts):
+                                    addr = self.get_acpi_from_pci(part)
+                                    if not addr:
+                                        continue
+                                    acpi_parts[i]+="@{}".format(addr)
+                            if acpi_parts[-1].startswith("pci-") and "@" in acpi_parts[-1]:
+                                # We're a PCI bridge - save our ven,dev as well
+                                pci_bridge = "pci{},{}@{}".format(
+                                    ven_id,
+                                    dev_id,
+                                    acpi_parts[-1].split("@")[-1]
+                                )
+                                acpi_parts = acpi_parts[:-1]+[pci_bridge]
+                                dev_dict[dev]["pci_bridge"] = pci_bridge
+                            acpi_formatted = "/"+"/".join(acpi_parts)
+                        dev_dict[dev]["device_path"] = dev_paths[0]
+                        dev_dict[dev]["acpi_path"] = acpi_formatted or "Unknown ACPI Path"
+                        dev_dict[dev]["built_in"] = built_in
+                        dev_dict[dev]["ven_dev"] = "{}:{}".format(ven_id,dev_id)
+                        if dev_name:
+                            dev_dict[dev]["name"] = dev_name
+                        if dev_paths[0] != dev_paths[1]:
+                            dev_dict[dev]["overflow_device_path"] = dev_paths[1]
                     except:
                         pass
                 elif key == "DEVPKEY_Device_Parent":
-                    # We should be able to scrape the address from the 
-                    # parent path.  Formatted like: ACPI_HAL\PNP0C08\0
-                    try:
-                        pci_dict[dev]["address"] = hex(int(val.strip().split("\\")[-1]))[2:].upper()
-                    except:
-                        pass
+                    if val.startswith(("ACPI\\")):
+                        # Must be the root parent path
+                        try:
+                            pci_root = "PciRoot(0x{})".format(hex(int(val.split("\\")[-1],16))[2:].upper())
+                            dev_dict[dev]["pci_root"] = pci_root
+                            dev_dict[dev]["pci_root_path"] = val.strip().upper()
+                        except:
+                            pass
+                    elif val.startswith("PCI\\"):
+                        # Got a parent path - keep track for later
+                        dev_dict[dev]["parent_path"] = val.upper()
                 elif key == "DEVPKEY_Device_Address":
-                    # Try to convert it to a number
+                    # Got the address
+                    dev_dict[dev]["address"] = int(val)
+                elif key == "DEVPKEY_Device_LocationInfo":
+                    # Gather our PCI bus, device, and function info.
                     try:
-                        pci_dict[dev]["address"] = hex(int(val.strip()))[2:].upper()
-                        if not pci_dict[dev].get("acpi_path"):
-                            # Set a pci-root/bus placeholder
-                            name = "pci-root@" if "PNP0A08" in dev else "pci-bus@"
-                            pci_dict[dev]["acpi_path"] = name+pci_dict[dev]["address"]
+                        m = self.b_d_f_re.match(val)
+                        a,b,c = m.group("bus"),m.group("device"),m.group("function")
+                        dev_dict[dev]["pcidebug"] = "{}:{}.{}".format(
+                            hex(int(a))[2:].rjust(2,"0"),
+                            hex(int(b))[2:].rjust(2,"0"),
+                            hex(int(c))[2:]
+                        )
                     except:
                         pass
-                # Check if we have the acpi_path, name, and address, and
-                # ensure the path reflects that
-                if all(x in pci_dict[dev] for x in ("acpi_path","acpi_name","address")):
-                    pci_dict[dev]["acpi_path"] = "{}@{}".format(
-                        pci_dict[dev]["acpi_path"].split("@")[0],
-                        pci_dict[dev]["address"]
-                    )
-                continue # Skip PCI checks
-            # We must have a PCI entry
-            if not dev in dev_dict:
-                # Initialize the device if needed
-                dev_dict[dev] = {}
-            if key == "DEVPKEY_Device_LocationPaths":
-                # Got the location paths
-                try:
-                    paths = val.lstrip("{").rstrip("}").split(", ")
-                    dev_path = next((p for p in paths if p.startswith("PCIROOT(")),"")
-                    acpi_path = next((p for p in paths if p.startswith("ACPI(")),"")
-                    # Only check built_in if we have an ACPI path
-                    built_in = "???"
-                    if acpi_path:
-                        built_in = "YES" if all(x.startswith("ACPI(") for x in acpi_path.split("#")) else "NO"
-                    else:
-                        # Mirror the PCI path under _SB_ if no
-                        # ACPI path was located
-                        acpi_path = "ACPI(_SB_)#"+dev_path
-                    try: ven_id = dev.split("VEN_")[1][:4].lower()
-                    except: ven_id = "????"
-                    try: dev_dict[dev]["vendor-id"] = int(ven_id,16)
-                    except: pass
-                    try: dev_id = dev.split("DEV_")[1][:4].lower()
-                    except: dev_id = "????"
-                    try: dev_dict[dev]["device-id"] = int(dev_id,16)
-                    except: pass
-                    try:
-                        subvensys_id = dev.split("SUBSYS_")[1][:8].lower()
-                        dev_dict[dev]["subsystem-vendor-id"] = int(subvensys_id[:4],16)
-                        dev_dict[dev]["subsystem-id"] = int(subvensys_id[4:],16)
-                    except:
-                        pass
-                    dev_name = None
-                    if acpi_path.split("#")[-1].startswith("ACPI("):
-                        dev_name = acpi_path.split("ACPI(")[-1].split(")")[0].rstrip("_")
-                    dev_paths = self.sanitize_device_path(dev_path)
-                    if not dev_paths:
-                        dev_paths = ("Unknown Device Path","Unknown Device Path")
-                    acpi_formatted = self.format_acpi_path(acpi_path)
-                    # Let's reformat the ACPI path - if any, skip the 
-                    # first entry as it isn't considered in gfxutil (i.e. _SB)
-                    if acpi_formatted:
-                        # Make sure to prefix our path with /
-                        acpi_parts = [a.rstrip("_") for a in acpi_formatted.split(".")[1:]]
-                        # Get our addresses from the PCI() elements
-                        pci_parts = dev_path.split("#")
-                        if len(pci_parts) == len(acpi_parts):
-                            # Walk the pci parts and keep track of the addressing
-                            for i,part in enumerate(pci_parts):
-                                addr = self.get_acpi_from_pci(part)
-                                if not addr:
-                                    continue
-                                acpi_parts[i]+="@{}".format(addr)
-                        if acpi_parts[-1].startswith("pci-") and "@" in acpi_parts[-1]:
-                            # We're a PCI bridge - save our ven,dev as well
-                            pci_bridge = "pci{},{}@{}".format(
-                                ven_id,
-                                dev_id,
-                                acpi_parts[-1].split("@")[-1]
-                            )
-                            acpi_parts = acpi_parts[:-1]+[pci_bridge]
-                            dev_dict[dev]["pci_bridge"] = pci_bridge
-                        acpi_formatted = "/"+"/".join(acpi_parts)
-                    dev_dict[dev]["device_path"] = dev_paths[0]
-                    dev_dict[dev]["acpi_path"] = acpi_formatted or "Unknown ACPI Path"
-                    dev_dict[dev]["built_in"] = built_in
-                    dev_dict[dev]["ven_dev"] = "{}:{}".format(ven_id,dev_id)
-                    if dev_name:
-                        dev_dict[dev]["name"] = dev_name
-                    if dev_paths[0] != dev_paths[1]:
-                        dev_dict[dev]["overflow_device_path"] = dev_paths[1]
-                except:
-                    pass
-                dev = None # Reset
-            elif key == "DEVPKEY_Device_Parent":
-                if val.startswith(("ACPI\\")):
-                    # Must be the root parent path
-                    try:
-                        pci_root = "PciRoot(0x{})".format(hex(int(val.split("\\")[-1],16))[2:].upper())
-                        dev_dict[dev]["pci_root"] = pci_root
-                        dev_dict[dev]["pci_root_path"] = val.strip().upper()
-                    except:
-                        pass
-                elif val.startswith("PCI\\"):
-                    # Got a parent path - keep track for later
-                    dev_dict[dev]["parent_path"] = val.upper()
-            elif key == "DEVPKEY_Device_Address":
-                # Got the address
-                dev_dict[dev]["address"] = int(val)
-            elif key == "DEVPKEY_Device_LocationInfo":
-                # Gather our PCI bus, device, and function info.
-                try:
-                    m = self.b_d_f_re.match(val)
-                    a,b,c = m.group("bus"),m.group("device"),m.group("function")
-                    dev_dict[dev]["pcidebug"] = "{}:{}.{}".format(
-                        hex(int(a))[2:].rjust(2,"0"),
-                        hex(int(b))[2:].rjust(2,"0"),
-                        hex(int(c))[2:]
-                    )
-                except:
-                    pass
-            elif key == "DEVPKEY_NAME":
-                # Got the device name
-                dev_dict[dev]["friendly_name"] = val.strip()
-            elif key == "DEVPKEY_PciDevice_BaseClass":
-                # Got the base class
-                try: dev_dict[dev]["base-class"] = int(val.strip())
-                except: continue
-            elif key == "DEVPKEY_PciDevice_SubClass":
-                # Got the sub class
-                try: dev_dict[dev]["sub-class"] = int(val.strip())
-                except: continue
-            elif key == "DEVPKEY_PciDevice_ProgIf":
-                # Got the programming interface
-                try: dev_dict[dev]["programming-interface"] = int(val.strip())
-                except: continue
-                # Check if we got all our class info and build
-                # our 32-bit int as needed
-                c = dev_dict[dev].get("base-class")
-                s = dev_dict[dev].get("sub-class")
-                p = dev_dict[dev].get("programming-interface")
-                if all(x is not None for x in (c,s,p)):
-                    # Class code uses 0xAAAABBCC type formatting
-                    cc = (c << 16) + (s << 8) + p
-                    dev_dict[dev]["class-code"] = cc
-        # Resolve all parents to their pci_root
+                elif key == "DEVPKEY_NAME":
+                    # Got the device name
+                    dev_dict[dev]["friendly_name"] = val.strip()
+                elif key == "DEVPKEY_PciDevice_BaseClass":
+                    # Got the base class
+                    try: dev_dict[dev]["base-class"] = int(val)
+                    except: continue
+                elif key == "DEVPKEY_PciDevice_SubClass":
+                    # Got the sub class
+                    try: dev_dict[dev]["sub-class"] = int(val)
+                    except: continue
+                elif key == "DEVPKEY_PciDevice_ProgIf":
+                    # Got the programming interface
+                    try: dev_dict[dev]["programming-interface"] = int(val)
+                    except: continue
+                    # Check if we got all our class info and build
+                    # our 32-bit int as needed
+                    c = dev_dict[dev].get("base-class")
+                    s = dev_dict[dev].get("sub-class")
+                    p = dev_dict[dev].get("programming-interface")
+                    if all(x is not None for x in (c,s,p)):
+                        # Class code uses 0xAAAABBCC type formatting
+                        cc = (c << 16) + (s << 8) + p
+                        dev_dict[dev]["class-code"] = cc
+        # Resolve all parents to their pci_root.  Each device visited
+        # while walking a chain is memoized with the pci_root found at the
+        # top (or None if the chain is orphaned, cyclic, or has no root),
+        # so shared ancestors are only walked once.
+        top_roots = {}
         for dev in dev_dict:
             # Make sure we have a root path, an ACPI path, and that our
             # root path exists in and corresponds to a valid ACPI path
@@ -332,30 +545,38 @@ class CheckPCI:
             if not "parent_path" in dev_dict[dev]:
                 continue # No need - skip
             # Let's resolve this to the top parent
-            seen = []
+            chain = []
+            seen = set()
+            pci_root = None
             p = dev
             while True:
+                if p in top_roots:
+                    # Already resolved this one
+                    pci_root = top_roots[p]
+                    break
                 # Check if we have another parent
                 if not p in dev_dict:
                     # Found an orphan - just bail
                     break
+                chain.append(p)
+                seen.add(p)
                 _p = dev_dict[p].get("parent_path")
                 if _p:
                     if _p in seen:
                         # Cyclic?
                         break
-                    # Save it for later
-                    seen.append(_p)
                     # Keep going
                     p = _p
                     continue
                 # We reached the top - check
                 # for a pci_root
-                if dev_dict[p].get("pci_root"):
-                    # Let's update ours to match this
-                    pci_root = dev_dict[p]["pci_root"]
-                    dev_dict[dev]["pci_root"] = pci_root
+                pci_root = dev_dict[p].get("pci_root")
                 break
+            for p in chain:
+                top_roots[p] = pci_root
+            if pci_root:
+                # Let's update ours to match this
+                dev_dict[dev]["pci_root"] = pci_root
         # Ensure all elements have the correct pci_root
         for dev in dev_dict:
             pci_root = dev_dict[dev].get("pci_root","PciRoot(0x0)")
@@ -364,57 +585,104 @@ class CheckPCI:
             dev_path.startswith(pci_root):
                 dev_dict[dev]["device_path"] = "/".join([pci_root]+dev_path.split("/")[1:])
         # Ensure all our pci@x,y entries that were populated with
-        # ven/dev ids are updated to pciVEN,DEV@x,y formatting
+        # ven/dev ids are updated to pciVEN,DEV@x,y formatting.
+        # Index every device path in a prefix tree keyed by path
+        # component so each bridge only visits the devices behind it.
+        # The list of devices at each node is kept under the None key.
+        trie = {}
+        for dev in dev_dict:
+            dev_path = dev_dict[dev].get("device_path")
+            if not dev_path:
+                continue
+            node = trie
+            for comp in dev_path.split("/"):
+                node = node.setdefault(comp,{})
+            node.setdefault(None,[]).append(dev)
+        # Hold the split ACPI paths we touch so they're only split and
+        # joined once, no matter how many bridges they sit behind
+        acpi_parts = {}
         for dev in dev_dict:
             if not dev_dict[dev].get("pci_bridge") or not dev_dict[dev].get("device_path"):
                 # This isn't bridged or is missing a device path,
                 # we don't need to update
                 continue
-            dev_path = dev_dict[dev]["device_path"]
-            # We got a bridged device - let's check for every
-            # device which starts with the same device path, and
-            # update the Nth entry of the ACPI path to reflect
-            # our bridge.
-            for d in dev_dict:
-                if d == dev or dev_dict[d].get("built_in") == "YES" \
-                or not dev_dict[d].get("device_path","").startswith(dev_path) \
-                or not dev_dict[d].get("acpi_path") or dev_dict[d]["acpi_path"].startswith("Unknown "):
-                    # Don't check ourselves or broken/unrelated entries
-                    continue
-                # Replace the Nth entry in the ACPI path with our
-                # bridge
-                n = dev_path.count("/")+1
-                a = dev_dict[d]["acpi_path"].split("/")
-                a[n] = dev_dict[dev]["pci_bridge"]
-                dev_dict[d]["acpi_path"] = "/".join(a)
+            # We got a bridged device - let's walk every device which
+            # starts with the same device path, and update the Nth entry
+            # of the ACPI path to reflect our bridge.
+            comps = dev_dict[dev]["device_path"].split("/")
+            n = len(comps)
+            node = trie
+            for comp in comps:
+                node = node[comp]
+            stack = [node]
+            while stack:
+                node = stack.pop()
+                for key,value in node.items():
+                    if key is not None:
+                        stack.append(value)
+                        continue
+                    for d in value:
+                        if d == dev or dev_dict[d].get("built_in") == "YES" \
+                        or not dev_dict[d].get("acpi_path") or dev_dict[d]["acpi_path"].startswith("Unknown "):
+                            # Don't check ourselves or broken entries
+                            continue
+                        # Replace the Nth entry in the ACPI path with our
+                        # bridge
+                        a = acpi_parts.get(d)
+                        if a is None:
+                            a = acpi_parts[d] = dev_dict[d]["acpi_path"].split("/")
+                        a[n] = dev_dict[dev]["pci_bridge"]
+        for d,a in acpi_parts.items():
+            dev_dict[d]["acpi_path"] = "/".join(a)
         # Return the info
         return dev_dict
 
-    def get_ps_entries(self,include_names=False, ps_output=None):
+    def get_ps_entries(self,include_names=False, ps_output=None, keep_info=True, query=None):
+        return list(self.iter_ps_entries(include_names=include_names,ps_output=ps_output,keep_info=keep_info,query=query))
+
+    def iter_ps_entries(self,include_names=False, ps_output=None, keep_info=True, query=None):
+        # The devices are gathered right away as their paths depend on
+        # one another - each row is only built as it's iterated.  Rows
+        # failing the passed compile_query() checks are left out.
         all_devs = self.get_pci_dict(ps_output=ps_output)
-        rows = []
-        for p in all_devs.values():
-            rows.append({
-                "name":p.get("name",""),
-                "row":[
-                    p.get("pcidebug","??:??.?"),
-                    p.get("ven_dev","????:????"),
-                    p.get("built_in","???"),
-                    p.get("acpi_path","Unknown ACPI Path"),
-                    p.get("device_path","Unknown Device Path")
-                ],
-                "dict":{
-                    "info":p,
-                    "device_path":p.get("device_path")
-                }
-            })
-            if include_names:
+        rows = (self._get_ps_row(p,include_names=include_names,keep_info=keep_info,query=query) for p in all_devs.values())
+        return (r for r in rows if r is not None)
+
+    def _get_ps_row(self,p,include_names=False,keep_info=True,query=None):
+        if query and query["name"] is not None and p.get("name","").lower() != query["name"]:
+            return None
+        built_in = p.get("built_in")
+        built_in = None if built_in not in ("YES","NO") else built_in == "YES"
+        if query and query["match"] and not self._query_fields(query["match"],(
+            (0,p.get("pcidebug")),
+            (1,(p.get("vendor-id"),p.get("device-id"))),
+            (2,built_in),
+            (3,p.get("acpi_path")),
+            (4,p.get("device_path"))
+        )):
+            return None
+        r = PCIDevice(
+            name=p.get("name",""),
+            pcidebug=p.get("pcidebug"),
+            vendor_id=p.get("vendor-id"),
+            device_id=p.get("device-id"),
+            built_in=built_in,
+            acpi_path=p.get("acpi_path"),
+            device_path=p.get("device_path"),
+            info=p if keep_info else None
+        )
+        if include_names:
+            if query and not query["names"]:
+                # Not shown or matched - skip the lookup
+                r.friendly_name = ""
+            else:
                 # Try to use the pci.ids(.gz) info first for consistency,
                 # fall back on anything scraped from the PCI output after
                 d_info = self.i.get_device_info_from_pci_ids(p)
-                name = p.get("friendly_name","") if not d_info or not d_info.get("device") else d_info["device"]
-                rows[-1]["row"].append(name)
-        return rows
+                r.friendly_name = p.get("friendly_name","") if not d_info or not d_info.get("device") else d_info["device"]
+        if query and not self._query_columns(r,query["name_match"]):
+            return None
+        return r
 
     def get_row(self, row, column_list=None):
         # Takes an interable row and compares with
@@ -444,57 +712,154 @@ class CheckPCI:
                 new_row.append(x)
         return new_row
 
-    def get_ioreg_entries(self,include_names=False):
+    def get_ioreg_entries(self,include_names=False,pci_devices=None,keep_info=True,query=None):
+        return list(self.iter_ioreg_entries(include_names=include_names,pci_devices=pci_devices,keep_info=keep_info,query=query))
+
+    def iter_ioreg_entries(self,include_names=False,pci_devices=None,keep_info=True,query=None):
+        # The devices are gathered right away - each row is only built
+        # as it's iterated.  Rows failing the passed compile_query()
+        # checks are left out.
         all_devs = self.i.get_all_devices()
-        # Walk the entries and process them as needed - returning
-        # the values expected, in order
-        rows = []
-        for p in all_devs.values():
-            p_dict = p.get("info",{})
-            ven = p_dict.get("vendor-id")
-            dev = p_dict.get("device-id")
-            if not (ven and dev):
-                continue # Missing info - skip
-            pcidebug = "??:??.?"
-            if "pcidebug" in p_dict:
-                # Try to organize it the same way gfxutil does
-                try:
-                    a,b,c = p_dict["pcidebug"].strip('"').split("(")[0].split(":")
-                    pcidebug = "{}:{}.{}".format(
-                        hex(int(a))[2:].rjust(2,"0"),
-                        hex(int(b))[2:].rjust(2,"0"),
-                        hex(int(c))[2:]
-                    )
-                except:
-                    pass
-            vendev = "????:????"
+        rows = (self._get_ioreg_row(p,include_names=include_names,pci_devices=pci_devices,keep_info=keep_info,query=query) for p in all_devs.values())
+        return (r for r in rows if r is not None)
+
+    def _get_ioreg_row(self,p,include_names=False,pci_devices=None,keep_info=True,query=None):
+        # Returns the row for the passed get_all_devices() entry, or None
+        # if it's missing its ids or was filtered out
+        if query and query["name"] is not None and p.get("name_no_addr","").lower() != query["name"]:
+            return None
+        p_dict = p.get("info",{})
+        ven = p_dict.get("vendor-id")
+        dev = p_dict.get("device-id")
+        if not (ven and dev):
+            return None # Missing info - skip
+        match = query["match"] if query else None
+        built_in = bool(p_dict.get("acpi-path"))
+        # Check the paths first as they're already formatted
+        if match and not self._query_fields(match,(
+            (2,built_in),
+            (3,p.get("acpi_path")),
+            (4,p.get("device_path"))
+        )):
+            return None
+        pcidebug = None
+        if "pcidebug" in p_dict:
+            # Try to organize it the same way gfxutil does
             try:
-                # Swap endianness of each 16-bit value and format
-                ven = binascii.hexlify(binascii.unhexlify(ven[1:5])[::-1]).decode()
-                dev = binascii.hexlify(binascii.unhexlify(dev[1:5])[::-1]).decode()
-                vendev = "{}:{}".format(ven,dev)
+                a,b,c = p_dict["pcidebug"].strip('"').split("(")[0].split(":")
+                pcidebug = "{}:{}.{}".format(
+                    hex(int(a))[2:].rjust(2,"0"),
+                    hex(int(b))[2:].rjust(2,"0"),
+                    hex(int(c))[2:]
+                )
             except:
                 pass
-            builtin = "NO"
-            if p_dict.get("acpi-path"):
-                builtin = "YES"
-            acpi = p.get("acpi_path","Unknown ACPI Path")
-            device = p.get("device_path","Unknown Device Path")
-            rows.append({
-                "name":p.get("name_no_addr",""),
-                "row":[pcidebug,vendev,builtin,acpi,device],
-                "dict":p
-            })
-            if include_names:
-                rows[-1]["row"].append(self.i.get_pci_device_name(p_dict))
-        return rows
+        if match and not self._query_fields(match,((0,pcidebug),)):
+            return None
+        try:
+            # Swap endianness of each 16-bit value
+            ven = int(binascii.hexlify(binascii.unhexlify(ven[1:5])[::-1]),16)
+            dev = int(binascii.hexlify(binascii.unhexlify(dev[1:5])[::-1]),16)
+        except:
+            ven = dev = None
+        if match and not self._query_fields(match,((1,(ven,dev)),)):
+            return None
+        r = PCIDevice(
+            name=p.get("name_no_addr",""),
+            pcidebug=pcidebug,
+            vendor_id=ven,
+            device_id=dev,
+            built_in=built_in,
+            acpi_path=p.get("acpi_path"),
+            device_path=p.get("device_path"),
+            info=p_dict if keep_info else None
+        )
+        if include_names:
+            if query and not query["names"]:
+                # Not shown or matched - skip the lookup
+                r.friendly_name = ""
+            else:
+                r.friendly_name = self.i.get_pci_device_name(p_dict,pci_devices=pci_devices)
+        if query and not self._query_columns(r,query["name_match"]):
+            return None
+        return r
+
+    def _iter_dump_lines(self, path, chunk_size=1048576):
+        # Yields the lines of a local dump without reading the whole file
+        # at once.  Null chars are dropped (this handles the UTF-16 that
+        # Windows Powershell redirects write), along with carriage returns.
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        tail = ""
+        with open(path,"rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                lines = (tail+decoder.decode(chunk.replace(b"\x00",b""),final=not chunk)).replace("\r","").split("\n")
+                tail = lines.pop()
+                for line in lines:
+                    yield line
+                if not chunk:
+                    break
+        if tail:
+            yield tail
+
+    def _read_ioreg(self, ioreg_path, include_names=False, pci_devices=None, keep_info=True, stream=False, query=None):
+        # Reads the passed dump, sniffs whether it came from macOS or
+        # Windows, and returns a tuple of the (ioreg_type, rows).  Raises
+        # an exception if it can't be read or its type is unknown.  With
+        # stream set, rows is an iterator instead of a list.
+        with open(ioreg_path,"rb") as f:
+            binary = f.read(8) == b"bplist00"
+        if binary:
+            # Binary ioreg -a archive - can't be read as text
+            return ("macOS ioreg binary archive",self._read_ioreg_archive(ioreg_path,include_names=include_names,pci_devices=pci_devices,keep_info=keep_info,stream=stream,query=query))
+        lines = self._iter_dump_lines(ioreg_path)
+        # Skip any leading whitespace to get to the first line
+        first = next((l for l in lines if l.strip()),"").lstrip()
+        # We need to determine if this is a macOS or Windows file
+        if first.startswith("+-o "):
+            # Likely a macOS ioreg dump - the whole thing is kept
+            ioreg_data = [first]+list(lines)
+            while len(ioreg_data) > 1 and not ioreg_data[-1].strip():
+                ioreg_data.pop()
+            ioreg_data[-1] = ioreg_data[-1].rstrip()
+            self.i.ioreg["IOService"] = ioreg_data
+            entries = self.iter_ioreg_entries if stream else self.get_ioreg_entries
+            return ("macOS ioreg dump",entries(include_names=include_names,pci_devices=pci_devices,keep_info=keep_info,query=query))
+        elif first.startswith(("<?xml","<!DOCTYPE plist","<plist")):
+            # Likely an XML ioreg -a archive
+            lines.close()
+            return ("macOS ioreg archive",self._read_ioreg_archive(ioreg_path,include_names=include_names,pci_devices=pci_devices,keep_info=keep_info,stream=stream,query=query))
+        entries = self.iter_ps_entries if stream else self.get_ps_entries
+        if first.startswith(("InstanceId","DeviceID")):
+            # Likely a Windows powershell dump - stream the rest of the
+            # lines straight into the parser
+            return ("Windows Powershell dump",entries(include_names=include_names,ps_output=itertools.chain([first],lines),keep_info=keep_info,query=query))
+        elif first.startswith(("[","{")):
+            # Likely a Windows powershell ConvertTo-Json dump
+            return ("Windows Powershell JSON dump",entries(include_names=include_names,ps_output=itertools.chain([first],lines),keep_info=keep_info,query=query))
+        # Unknown approach - just throw an error
+        raise Exception("Unknown ioreg type")
+
+    def _read_ioreg_archive(self, ioreg_path, include_names=False, pci_devices=None, keep_info=True, stream=False, query=None):
+        # Loads an ioreg -a dump (XML or binary plist) and hands the root
+        # entry to IOReg, which walks its IORegistryEntryChildren directly
+        from Scripts import plist
+        with open(ioreg_path,"rb") as f:
+            root = plist.load(f)
+        if isinstance(root,list):
+            # ioreg -a -r dumps hold a list of the matched entries
+            root = {"IORegistryEntryChildren":root}
+        if not isinstance(root,dict) or not root:
+            raise Exception("Unknown ioreg archive layout")
+        self.i.ioreg["IOService"] = root
+        entries = self.iter_ioreg_entries if stream else self.get_ioreg_entries
+        return entries(include_names=include_names,pci_devices=pci_devices,keep_info=keep_info,query=query)
 
-    def _load_ioreg(self, ioreg_override, include_names=False):
+    def _load_ioreg(self, ioreg_override, include_names=False, keep_info=True, stream=False, quiet=False, query=None):
         # Change to this directory for relative pathing
         os.chdir(os.path.dirname(os.path.realpath(__file__)))
         # Resolve the path
         ioreg_path = self.u.check_path(ioreg_override)
-        ioreg_type = "macOS ioreg dump"
         if not ioreg_path:
             print("'{}' does not exist!".format(ioreg_override))
             exit(1)
@@ -503,35 +868,12 @@ class CheckPCI:
             exit(1)
         # Try loading it
         try:
-            with open(ioreg_path,"rb") as f:
-                # Read the data, replace null chars,
-                # decode to a string, strip whitespace,
-                # replace carriage returns, and split
-                # by newlines (yay)
-                ioreg_data = f.read() \
-                .replace(b"\x00",b"") \
-                .decode(errors="ignore") \
-                .strip() \
-                .replace("\r","") \
-                .split("\n")
-            # Make sure we got *something*
-            assert ioreg_data
-            # We need to determine if this is a macOS or Windows file
-            if ioreg_data[0].startswith("+-o "):
-                # Likely a macOS ioreg dump
-                self.i.ioreg["IOService"] = ioreg_data
-                rows = self.get_ioreg_entries(include_names=include_names)
-            elif ioreg_data[0].startswith(("InstanceId","DeviceID")):
-                ioreg_type = "Windows Powershell dump"
-                # Likely a Windows powershell dump
-                rows = self.get_ps_entries(include_names=include_names,ps_output=ioreg_data)
-            else:
-                # Unknown approach - just throw an error
-                raise Exception("Unknown ioreg type")
+            ioreg_type,rows = self._read_ioreg(ioreg_path,include_names=include_names,keep_info=keep_info,stream=stream,query=query)
         except Exception as e:
             print("Failed to read '{}': {}".format(ioreg_override,e))
             exit(1)
-        print("Using local {}: {}".format(ioreg_type,ioreg_path))
+        if not quiet:
+            print("Using local {}: {}".format(ioreg_type,ioreg_path))
         return rows
 
     def save_plist(self,plist_path,ioreg_override=None):
@@ -539,6 +881,7 @@ class CheckPCI:
         if ioreg_override is not None:
             rows = self._load_ioreg(ioreg_override)
         else:
+            self.check_local_os()
             # Get our device list based on our OS
             if os.name == "nt":
                 rows = self.get_ps_entries()
@@ -551,9 +894,8 @@ class CheckPCI:
         }
         dev_props = devices["DeviceProperties"]["Add"]
         for r in rows:
-            rd = r.get("dict",{})
-            p = rd.get("device_path")
-            d = rd.get("info")
+            p = r.device_path
+            d = r.info
             if not p or not d:
                 continue # Borked
             d_info = self.i.get_device_info_from_pci_ids(d)
@@ -591,83 +933,211 @@ class CheckPCI:
             }
             # Check for built-in and warn if not - but only if
             # we have an ACPI path
-            try:
-                if r["row"][2] == "NO":
-                    dev_props[p]["# WARNING - Not Built-in"]="Device properties may not take effect unless PCI bridges are defined in ACPI"
-            except:
-                pass
+            if r.built_in is False:
+                dev_props[p]["# WARNING - Not Built-in"]="Device properties may not take effect unless PCI bridges are defined in ACPI"
+        from Scripts import plist
         with open(plist_path,"wb") as f:
             plist.dump(devices,f)
 
-    def main(self,device_name=None,columns=None,column_match=None,include_names=False,ioreg_override=None):
-        if device_name is not None and not isinstance(device_name,str):
-            device_name = str(device_name)
+    def _get_display_columns(self,columns=None,include_names=False):
         if include_names and not self.default_columns[-1][0] == "FriendlyName":
             self.default_columns.append(("FriendlyName",0))
+        if not isinstance(columns,(list,tuple)):
+            return None
         display_columns = []
-        if isinstance(columns,(list,tuple)):
-            for c in columns:
-                try:
-                    c = int(c)
-                    self.default_columns[c]
-                    if not c in display_columns:
-                        display_columns.append(c)
-                except:
-                    pass
-        else:
-            display_columns = None
+        for c in columns:
+            try:
+                c = int(c)
+                self.default_columns[c]
+                if not c in display_columns:
+                    display_columns.append(c)
+            except:
+                pass
+        return display_columns
+
+    def compile_query(self,device_name=None,column_match=None,display_columns=None,include_names=False):
+        # Splits the -f, -m, and -c options into the checks the row
+        # builders run as they go.  The name and the other columns are
+        # checked against the raw device info before the row is built,
+        # and friendly names are only looked up if they're displayed or
+        # matched against.
+        column_match = column_match or []
+        name_match = [(c,v) for c,v in column_match if c == self.name_column]
+        return {
+            "name":device_name.lower() if device_name else None,
+            "match":[(c,v) for c,v in column_match if c != self.name_column],
+            "name_match":name_match,
+            "names":include_names and (bool(name_match) or not display_columns or self.name_column in display_columns)
+        }
+
+    def _query_fields(self,column_match,fields):
+        # Checks the raw (index,value) field pairs against the matches
+        # for those columns before any row is built for them
+        for c,v in column_match:
+            for index,value in fields:
+                if index == c and PCIDevice.format_column(index,value).lower() != v:
+                    return False
+        return True
+
+    def _query_columns(self,r,column_match):
+        for c,v in column_match:
+            value = r.column(c)
+            if value is None or value.lower() != v:
+                return False
+        return True
+
+    def _row_matches(self,r,device_name=None,column_match=None):
+        # Check our name if we are looking for one
+        if device_name and not r.name.lower() == device_name.lower():
+            return False # Not our device name
+        # Ensure our columns match if needed
+        if column_match:
+            values = r.row
+            for c,v in column_match:
+                if c >= len(values) or values[c].lower() != v:
+                    return False # Out of range or no match
+        return True
+
+    def get_dev_list(self,rows,device_name=None,display_columns=None,column_match=None,include_names=False):
         # Keep track of how far back we need to look for
         # pathing entries
         check_back,check_rem = (-3,-1) if include_names else (-2,None)
-        # Check if we got an ioreg override file path
-        if ioreg_override is not None:
-            rows = self._load_ioreg(ioreg_override,include_names=include_names)
-        else:
-            # Get our device list based on our OS
-            if os.name == "nt":
-                rows = self.get_ps_entries(include_names=include_names)
-            else:
-                rows = self.get_ioreg_entries(include_names=include_names)
         dev_list = []
         # Iterate those devices
         for r in rows:
-            # Check our name if we are looking for one
-            if device_name and not r.get("name","").lower() == device_name.lower():
-                continue # Not our device name - skip
-            # Ensure our columns match if needed
-            if column_match:
-                matched = True
-                for c,v in column_match:
-                    if c >= len(r["row"]) or r["row"][c].lower() != v:
-                        # Out of range
-                        matched = False
-                        continue
-                if not matched:
-                    continue # No match
+            if not self._row_matches(r,device_name=device_name,column_match=column_match):
+                continue
+            values = r.row
             # Parse the info based on our columns
             row = self.get_row(
-                r["row"],
+                values,
                 column_list=display_columns
             )
-            if row[check_back:check_rem] == r["row"][check_back:check_rem]:
+            if row[check_back:check_rem] == values[check_back:check_rem]:
                 # Special handler to join ACPI and Device paths
                 # with " = "
-                row = row[:check_back]+[" = ".join(r["row"][check_back:check_rem])]
+                row = row[:check_back]+[" = ".join(values[check_back:check_rem])]
                 if check_rem is not None:
                     # Append the remainder separated by spaces again
-                    row += r["row"][check_rem:]
+                    row += values[check_rem:]
             # Add to the list
             dev_list.append(" ".join(row))
-        if not dev_list:
-            # Nothing was returned - adjust output based on
-            # whether or not we're searching
-            if device_name is None and column_match is None:
-                print("No PCI devices located!")
-            elif column_match:
-                print("No devices matching the passed info were found!")
+        return dev_list
+
+    def _sort_bdf(self,r):
+        try:
+            b,df = r.pcidebug.split(":")
+            d,f = df.split(".")
+            return (0,(int(b,16),int(d,16),int(f,16)))
+        except:
+            return (1,())
+
+    def _sort_ids(self,r):
+        if r.vendor_id is None or r.device_id is None:
+            return (1,(0,0))
+        return (0,(r.vendor_id,r.device_id))
+
+    def _sort_acpi(self,r):
+        if not r.acpi_path or not r.acpi_path.startswith("/"):
+            return (1,"")
+        return (0,r.acpi_path)
+
+    def _sort_path(self,r):
+        # PciRoot(0x0)/Pci(0x1C,0x4) -> ((0,),(28,4))
+        try:
+            return (0,tuple(tuple(int(x,16) for x in c.split("(")[1].rstrip(")").split(",")) for c in r.device_path.split("/")))
+        except:
+            return (1,())
+
+    def _sort_depth(self,r):
+        if not r.device_path or not r.device_path.startswith("PciRoot("):
+            return (1,0)
+        return (0,r.device_path.count("/"))
+
+    def _sort_name(self,r):
+        return (not r.name,r.name.lower())
+
+    def _sort_builtin(self,r):
+        return (r.built_in is None,bool(r.built_in))
+
+    def _sort_desc(self,func):
+        # Each _sort_<key>() returns a (missing,value) pair - only the
+        # value is reversed so rows missing it still sort last
+        def key(r):
+            missing,value = func(r)
+            return (missing,_Descending(value))
+        return key
+
+    def get_sort_key(self,sort_by):
+        # Builds a key function from a list of sort key names - each can
+        # have :desc appended to reverse its order (or :asc to be explicit)
+        funcs = []
+        for name in sort_by:
+            name,_,order = name.partition(":")
+            func = getattr(self,"_sort_"+name)
+            if order == "desc":
+                func = self._sort_desc(func)
+            funcs.append(func)
+        if len(funcs) == 1:
+            return funcs[0]
+        return lambda r: tuple(f(r) for f in funcs)
+
+    def select_rows(self,rows,sort_by=None,limit=None,device_name=None,column_match=None):
+        # Filters and orders the rows on their structured fields.  With a
+        # limit, only the first N are kept in a heap as the rows stream
+        # by - so the full list never needs to be built or sorted.
+        import heapq
+        rows = (r for r in rows if self._row_matches(r,device_name=device_name,column_match=column_match))
+        key = self.get_sort_key(sort_by or self.default_sort)
+        if limit is None:
+            return sorted(rows,key=key)
+        return heapq.nsmallest(limit,rows,key=key)
+
+    def _get_output_fields(self,display_columns=None,include_names=False):
+        # Returns the PCIDevice fields to write for the passed columns -
+        # the name is always included
+        fields = []
+        for f,c in self.output_fields:
+            if f == "friendly_name" and not include_names:
+                continue
+            if c is None or not display_columns or c in display_columns:
+                fields.append(f)
+        return fields
+
+    def write_rows(self,rows,f,output_format="json",device_name=None,display_columns=None,column_match=None,include_names=False):
+        # Serializes each matching row to the passed file object as it's
+        # pulled from rows, and returns how many were written.  Ids are
+        # kept as ints, and built-in as a bool (or null if unknown).
+        import json
+        from collections import OrderedDict
+        fields = self._get_output_fields(display_columns,include_names=include_names)
+        writer = None
+        if output_format == "csv":
+            import csv
+            writer = csv.writer(f,lineterminator="\n")
+            writer.writerow(fields)
+        elif output_format == "json":
+            f.write("[")
+        count = 0
+        for r in rows:
+            if not self._row_matches(r,device_name=device_name,column_match=column_match):
+                continue
+            values = [getattr(r,x) for x in fields]
+            if writer:
+                writer.writerow(values)
+            elif output_format == "json":
+                f.write(("," if count else "")+"\n  "+json.dumps(OrderedDict(zip(fields,values))))
             else:
-                print("No device matching '{}' was found!".format(device_name))
-            exit(1)
+                f.write(json.dumps(OrderedDict(zip(fields,values)))+"\n")
+                # Hand each line off right away for anything reading
+                # from the other end of a pipe
+                f.flush()
+            count += 1
+        if output_format == "json":
+            f.write("\n]\n" if count else "]\n")
+        return count
+
+    def get_dev_header(self,display_columns=None):
         # Gather our column headers
         header_row = self.get_row(
             [x[0] for x in self.default_columns],
@@ -681,16 +1151,257 @@ class CheckPCI:
             dev_header = dev_header.replace("ACPI","ACPI Path").replace("Device","Device Path")
         dev_header = dev_header.replace("ACPI Device","ACPI+Device")
         dev_header = dev_header.replace("ACPI+Device","ACPI+Device Path")
-        dev_list = [dev_header,"-"*len(dev_header)]+sorted(dev_list)
+        return dev_header
+
+    def get_no_devices_message(self,device_name=None,column_match=None):
+        # Adjust output based on whether or not we're searching
+        if device_name is None and column_match is None:
+            return "No PCI devices located!"
+        elif column_match:
+            return "No devices matching the passed info were found!"
+        return "No device matching '{}' was found!".format(device_name)
+
+    def get_batch_files(self,batch_path):
+        # Accepts a folder, a single file, or a glob pattern and returns
+        # a sorted list of the matching file paths
+        import glob
+        batch_path = os.path.expanduser(batch_path)
+        if os.path.isdir(batch_path):
+            files = [os.path.join(batch_path,x) for x in os.listdir(batch_path)]
+        else:
+            files = glob.glob(batch_path)
+        return sorted(os.path.abspath(x) for x in files if os.path.isfile(x) and not os.path.basename(x).startswith("."))
+
+    def batch(self,batch_path,output_folder="batch_results",jobs=None,device_name=None,columns=None,column_match=None,include_names=False,output_format="table",sort_by=None,limit=None):
+        import json, multiprocessing
+        # Change to this directory for relative pathing
+        os.chdir(os.path.dirname(os.path.realpath(__file__)))
+        files = self.get_batch_files(batch_path)
+        if not files:
+            print("No dumps found matching '{}'!".format(batch_path))
+            return 1
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+        output_folder = os.path.abspath(output_folder)
+        # Give each dump its own results file named after the dump - source
+        # extension included so io.txt and io.plist don't collide - and
+        # append a counter to any names shared across folders
+        tasks = []
+        used = set()
+        ext = ".txt" if output_format == "table" else "."+output_format
+        for path in files:
+            name,src_ext = os.path.splitext(os.path.basename(path))
+            out_name,count = name+src_ext,1
+            while out_name.lower() in used:
+                count += 1
+                out_name = "{}-{}{}".format(name,count,src_ext)
+            used.add(out_name.lower())
+            tasks.append((path,os.path.join(output_folder,out_name+ext),{
+                "device_name":device_name,
+                "columns":columns,
+                "column_match":column_match,
+                "include_names":include_names,
+                "output_format":output_format,
+                "sort_by":sort_by,
+                "limit":limit
+            }))
+        if not jobs or jobs < 1:
+            jobs = multiprocessing.cpu_count()
+        jobs = min(jobs,len(tasks))
+        print("Processing {:,} dump{} with {:,} worker{}...".format(
+            len(tasks),"" if len(tasks)==1 else "s",
+            jobs,"" if jobs==1 else "s"
+        ))
+        pool = None
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs)
+            # Hand out small chunks to keep the workers busy without
+            # letting one of them hoard the large dumps
+            results = pool.imap(_batch_worker,tasks,chunksize=max(1,len(tasks)//(jobs*4)))
+        else:
+            # Reuse this instance - no need to spin up another process
+            results = (_batch_worker(task,checkpci=self) for task in tasks)
+        summary = []
+        failed = 0
+        try:
+            for i,result in enumerate(results,start=1):
+                summary.append(result)
+                if result.get("error"):
+                    failed += 1
+                    print(" - {:,}/{:,} {} - failed: {}".format(i,len(tasks),os.path.basename(result["file"]),result["error"]))
+                else:
+                    print(" - {:,}/{:,} {} - {:,} device{} ({:,} not built-in)".format(
+                        i,len(tasks),os.path.basename(result["file"]),
+                        result["devices"],"" if result["devices"]==1 else "s",
+                        result["not_built_in"]
+                    ))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        summary_path = os.path.join(output_folder,"summary.json")
+        with open(summary_path,"w") as f:
+            json.dump(summary,f,indent=2)
+        print("Processed {:,} dump{} ({:,} failed) - results saved to '{}'".format(
+            len(summary),"" if len(summary)==1 else "s",failed,output_folder
+        ))
+        return 1 if failed else 0
+
+    def main(self,device_name=None,columns=None,column_match=None,include_names=False,ioreg_override=None,output_format="table",output_path=None,sort_by=None,limit=None):
+        if device_name is not None and not isinstance(device_name,str):
+            device_name = str(device_name)
+        display_columns = self._get_display_columns(columns,include_names=include_names)
+        # Rows are only ordered on their structured fields if asked - the
+        # table is otherwise sorted by its text as it always has been
+        ordered = sort_by is not None or limit is not None
+        # Anything other than the table is written as the rows are built -
+        # and nothing else can be printed if it's going to stdout
+        stream = output_format != "table" or ordered
+        # Filter the rows as they're built so anything that doesn't match
+        # is never fully formatted
+        query = self.compile_query(device_name,column_match,display_columns=display_columns,include_names=include_names)
+        # Check if we got an ioreg override file path
+        if ioreg_override is not None:
+            rows = self._load_ioreg(ioreg_override,include_names=include_names,keep_info=False,stream=stream,quiet=output_format != "table" and not output_path,query=query)
+        else:
+            self.check_local_os()
+            # Get our device list based on our OS - the raw properties
+            # aren't needed once the rows are built
+            if os.name == "nt":
+                entries = self.iter_ps_entries if stream else self.get_ps_entries
+                rows = entries(include_names=include_names,keep_info=False,query=query)
+            else:
+                if query["names"]:
+                    # Gather the IODeviceTree and system_profiler info
+                    # at the same time - only if the names are needed
+                    self.i.prefetch(planes=["IODeviceTree"],pci_devices=True)
+                entries = self.iter_ioreg_entries if stream else self.get_ioreg_entries
+                rows = entries(include_names=include_names,keep_info=False,query=query)
+        if ordered:
+            rows = self.select_rows(rows,sort_by=sort_by,limit=limit)
+        if output_format != "table":
+            f = open(output_path,"w") if output_path else sys.stdout
+            try:
+                count = self.write_rows(
+                    rows,
+                    f,
+                    output_format=output_format,
+                    display_columns=display_columns,
+                    include_names=include_names
+                )
+            except IOError as e:
+                import errno
+                if output_path or e.errno != errno.EPIPE:
+                    raise
+                # Whatever was reading stdout stopped - point it at devnull
+                # so the interpreter doesn't complain when flushing on exit
+                os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+                exit(1)
+            finally:
+                if output_path:
+                    f.close()
+            if output_path:
+                if not count:
+                    print(self.get_no_devices_message(device_name,column_match))
+                else:
+                    print("Saved {:,} device{} to '{}'".format(count,"" if count==1 else "s",output_path))
+            if not count:
+                exit(1)
+            return
+        dev_list = self.get_dev_list(
+            rows,
+            display_columns=display_columns,
+            include_names=include_names
+        )
+        if not dev_list:
+            # Nothing was returned
+            print(self.get_no_devices_message(device_name,column_match))
+            exit(1)
+        dev_header = self.get_dev_header(display_columns)
+        dev_list = [dev_header,"-"*len(dev_header)]+(dev_list if ordered else sorted(dev_list))
+        if output_path:
+            with open(output_path,"w") as f:
+                f.write("\n".join(dev_list)+"\n")
+            print("Saved {:,} device{} to '{}'".format(len(dev_list)-2,"" if len(dev_list)==3 else "s",output_path))
+            return
         print("\n".join(dev_list))
         if os.name == "nt":
             # Pause to prevent the window from closing prematurely
             self.u.grab("\nPress [enter] to exit...")
 
+# Each batch worker process keeps a single CheckPCI instance so the
+# pci.ids data is only loaded once per process
+_batch_checkpci = None
+
+def _batch_worker(task,checkpci=None):
+    global _batch_checkpci
+    path,out_path,kwargs = task
+    result = {"file":path}
+    try:
+        if checkpci is None:
+            if _batch_checkpci is None:
+                _batch_checkpci = CheckPCI()
+            checkpci = _batch_checkpci
+        device_name = kwargs.get("device_name")
+        column_match = kwargs.get("column_match")
+        include_names = kwargs.get("include_names",False)
+        display_columns = checkpci._get_display_columns(kwargs.get("columns"),include_names=include_names)
+        # Pass an empty list for pci_devices - the current machine's
+        # system_profiler info has nothing to do with these dumps
+        ioreg_type,rows = checkpci._read_ioreg(path,include_names=include_names,pci_devices=[],keep_info=False)
+        if checkpci._i is not None:
+            # Drop the parsed dump - only the rows are needed from here
+            checkpci.i.ioreg.pop("IOService",None)
+            checkpci.i.ioreg_tree.pop("IOService",None)
+        output_format = kwargs.get("output_format","table")
+        ordered = kwargs.get("sort_by") is not None or kwargs.get("limit") is not None
+        listed = rows
+        if ordered:
+            listed = checkpci.select_rows(rows,sort_by=kwargs.get("sort_by"),limit=kwargs.get("limit"),device_name=device_name,column_match=column_match)
+        match_name,match_columns = (None,None) if ordered else (device_name,column_match)
+        if output_format != "table":
+            with open(out_path,"w") as f:
+                matched = checkpci.write_rows(
+                    listed,
+                    f,
+                    output_format=output_format,
+                    device_name=match_name,
+                    display_columns=display_columns,
+                    column_match=match_columns,
+                    include_names=include_names
+                )
+        else:
+            dev_list = checkpci.get_dev_list(
+                listed,
+                device_name=match_name,
+                display_columns=display_columns,
+                column_match=match_columns,
+                include_names=include_names
+            )
+            if dev_list:
+                dev_header = checkpci.get_dev_header(display_columns)
+                dev_list = [dev_header,"-"*len(dev_header)]+(dev_list if ordered else sorted(dev_list))
+            else:
+                dev_list = [checkpci.get_no_devices_message(device_name,column_match)]
+            with open(out_path,"wb") as f:
+                f.write("\n".join(dev_list).encode())
+            matched = len(dev_list)-2 if len(dev_list) > 1 else 0
+        result.update({
+            "type":ioreg_type,
+            "devices":len(rows),
+            "matched":matched,
+            "not_built_in":len([r for r in rows if r.built_in is False]),
+            "output":out_path
+        })
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    return result
+
 if __name__ == '__main__':
     # Create our object to get values for the help output
     p = CheckPCI()
     available = ", ".join("{} - {}".format(i,x[0]) for i,x in enumerate(p.default_columns,start=1))
+    available_sort = ", ".join("{} - {}".format(x,d) for x,d in p.sort_keys)
     # Setup the cli args
     parser = argparse.ArgumentParser(prog="CheckPCI.py", description="CheckPCI - a py script to list PCI device info from the IODeviceTree.")
     parser.add_argument("-f", "--find-name", help="find device paths for objects with the passed name from the IODeviceTree")
@@ -701,12 +1412,21 @@ if __name__ == '__main__':
     parser.add_argument("-o", "--output-file", help="dump the current machine's ioreg/powershell info to the provided path relative to this script and exit")
     parser.add_argument("-p", "--save-plist", help="dump all detected PCI devices to the provided path relative to this script and exit")
     parser.add_argument("-u", "--update-pci-ids", help="download the latest pci.ids.gz file from https://pci-ids.ucw.cz and exit",action="store_true")
+    parser.add_argument("-k", "--check-pci-ids", help="check if the local pci.ids.gz file is up to date without downloading it and exit",action="store_true")
+    parser.add_argument("-b", "--batch", help="folder or glob pattern (relative to this script) of local ioreg/powershell dumps to process - saving results for each to the --batch-output folder and exit")
+    parser.add_argument("-d", "--batch-output", help="folder relative to this script to save --batch results and the summary.json to (default is batch_results)",default="batch_results")
+    parser.add_argument("-j", "--jobs", help="number of worker processes to use with --batch (default is the cpu count)",type=int)
+    parser.add_argument("-t", "--output-format", help="format to list the devices in - json, ndjson, and csv are written as each row is built (default is table)",choices=p.output_formats,default="table")
+    parser.add_argument("-s", "--save-output", help="save the device list to the provided path relative to this script instead of printing it")
+    parser.add_argument("-r", "--sort-by", help="comma delimited list of keys to sort the devices on in order - append :desc to a key to reverse it.  Options are:\n{}".format(available_sort))
+    parser.add_argument("-l", "--limit", help="only list the first LIMIT devices once sorted (sorted by {} unless --sort-by is passed)".format(",".join(p.default_sort)),type=int)
 
     args = parser.parse_args()
 
-    # Try to ensure we have the pci.ids(.gz) file
+    # Try to ensure we have the pci.ids(.gz) file - keeping quiet if
+    # json/ndjson/csv output is headed to stdout
     if any((args.save_plist,args.include_names)):
-        p.i._update_pci_ids_if_missing(quiet=False)
+        p.i._update_pci_ids_if_missing(quiet=args.output_format!="table" and not args.save_output and not args.save_plist)
 
     if args.output_file:
         # Change to this directory for relative pathing
@@ -755,6 +1475,12 @@ if __name__ == '__main__':
             exit(1)
         exit()
 
+    if args.check_pci_ids:
+        # Only report - exit with 1 if stale or the check failed
+        if not p.i._check_pci_ids(quiet=False):
+            exit(1)
+        exit()
+
     columns = None
     if args.column_list:
         # Ensure we have values that are valid
@@ -811,13 +1537,45 @@ if __name__ == '__main__':
         if not column_match:
             print("Invalid column match information passed.")
             exit(1)
+    sort_by = None
+    if args.sort_by is not None:
+        sort_by = [x.strip().lower() for x in args.sort_by.split(",") if x.strip()]
+        valid = [x for x,_ in p.sort_keys]
+        if not sort_by or any(not x.partition(":")[0] in valid or not x.partition(":")[2] in ("","asc","desc") for x in sort_by):
+            print("Invalid sort information passed.  Can only accept comma delimited keys from")
+            print("the following (with :desc appended to reverse):")
+            print(available_sort)
+            exit(1)
+    if args.limit is not None and args.limit < 1:
+        print("Invalid limit passed.  Must be 1 or higher.")
+        exit(1)
     find_name = None
     if args.find_name:
         find_name = args.find_name.strip().rstrip("_")
+    if args.batch:
+        exit(p.batch(
+            args.batch,
+            output_folder=args.batch_output,
+            jobs=args.jobs,
+            device_name=find_name,
+            columns=columns,
+            column_match=column_match,
+            include_names=args.include_names,
+            output_format=args.output_format,
+            sort_by=sort_by,
+            limit=args.limit
+        ))
+    if args.save_output:
+        # Change to this directory for relative pathing
+        os.chdir(os.path.dirname(os.path.realpath(__file__)))
     p.main(
         device_name=find_name,
         columns=columns,
         column_match=column_match,
         include_names=args.include_names,
-        ioreg_override=args.local_ioreg
+        ioreg_override=args.local_ioreg,
+        output_format=args.output_format,
+        output_path=args.save_output,
+        sort_by=sort_by,
+        limit=args.limit
     )
@@ -1,13 +1,14 @@
-import sys, os, time, ssl, gzip, multiprocessing
+import sys, os, time, ssl, zlib, threading, multiprocessing
 from io import BytesIO
 # Python-aware urllib stuff
 try:
     from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
     import queue as q
 except ImportError:
     # Import urllib2 to catch errors
     import urllib2
-    from urllib2 import urlopen, Request
+    from urllib2 import urlopen, Request, HTTPError
     import Queue as q
 
 TERMINAL_WIDTH = 120 if os.name=="nt" else 80
@@ -46,37 +47,50 @@ def get_size(size, suffix=None, use_1024=False, round_to=2, strip_zeroes=False):
     b = b.rstrip("0") if strip_zeroes else b.ljust(round_to,"0") if round_to > 0 else ""
     return "{:,}{} {}".format(int(a),"" if not b else "."+b,biggest)
 
-def _process_hook(queue, total_size, bytes_so_far=0, update_interval=1.0, max_packets=0):
+def _draw_progress(total_size, bytes_so_far, speed="", remaining=""):
+    if total_size > 0:
+        percent = float(bytes_so_far) / total_size
+        percent = round(percent*100, 2)
+        t_s = get_size(total_size)
+        try:
+            b_s = get_size(bytes_so_far, t_s.split(" ")[1])
+        except:
+            b_s = get_size(bytes_so_far)
+        perc_str = " {:.2f}%".format(percent)
+        bar_width = (TERMINAL_WIDTH // 3)-len(perc_str)
+        progress = "=" * int(bar_width * (percent/100))
+        sys.stdout.write("\r\033[K{}/{} | {}{}{}{}{}".format(
+            b_s,
+            t_s,
+            progress,
+            " " * (bar_width-len(progress)),
+            perc_str,
+            speed,
+            remaining
+        ))
+    else:
+        b_s = get_size(bytes_so_far)
+        sys.stdout.write("\r\033[K{}{}".format(b_s, speed))
+    sys.stdout.flush()
+
+def _process_hook(queue, total_size, bytes_so_far=0, update_interval=1.0, max_packets=0, redraw_interval=0):
+    # Draws the progress bar from packets sent over the queue - used as
+    # the target of both the progress thread and the legacy process.
+    # Redraws are limited to one per redraw_interval seconds.
     packets = []
     speed = remaining = ""
     last_update = time.time()
+    last_draw = 0
+    drawn = False
     while True:
         # Write our info first so we have *some* status while
         # waiting for packets
-        if total_size > 0:
-            percent = float(bytes_so_far) / total_size
-            percent = round(percent*100, 2)
-            t_s = get_size(total_size)
-            try:
-                b_s = get_size(bytes_so_far, t_s.split(" ")[1])
-            except:
-                b_s = get_size(bytes_so_far)
-            perc_str = " {:.2f}%".format(percent)
-            bar_width = (TERMINAL_WIDTH // 3)-len(perc_str)
-            progress = "=" * int(bar_width * (percent/100))
-            sys.stdout.write("\r\033[K{}/{} | {}{}{}{}{}".format(
-                b_s,
-                t_s,
-                progress,
-                " " * (bar_width-len(progress)),
-                perc_str,
-                speed,
-                remaining
-            ))
+        if time.time() - last_draw >= redraw_interval:
+            _draw_progress(total_size, bytes_so_far, speed, remaining)
+            last_draw = time.time()
+            drawn = True
         else:
-            b_s = get_size(bytes_so_far)
-            sys.stdout.write("\r\033[K{}{}".format(b_s, speed))
-        sys.stdout.flush()
+            drawn = False
         # Now we gather the next packet
         try:
             packet = queue.get(timeout=update_interval)
@@ -85,6 +99,9 @@ def _process_hook(queue, total_size, bytes_so_far=0, update_interval=1.0, max_pa
             # If "DONE" is passed, we assume the download
             # finished - and bail
             if packet == "DONE":
+                if not drawn:
+                    # Make sure the final state is shown
+                    _draw_progress(total_size, bytes_so_far, speed, remaining)
                 print("") # Jump to the next line
                 return
             # Append our packet to the list and ensure we're not
@@ -145,6 +162,10 @@ class Downloader:
     def __init__(self,**kwargs):
         self.ua = kwargs.get("useragent",{"User-Agent":"Mozilla"})
         self.chunk = 1048576 # 1024 x 1024 i.e. 1MiB
+        # Progress is drawn from a thread unless use_process is passed,
+        # and is redrawn at most once per redraw_interval seconds
+        self.use_process = kwargs.get("use_process",False)
+        self.redraw_interval = kwargs.get("redraw_interval",0.1)
         if os.name=="nt": os.system("color") # Initialize cmd for ANSI escapes
         # Provide reasonable default logic to workaround macOS CA file handling 
         cafile = ssl.get_default_verify_paths().openssl_cafile
@@ -194,6 +215,37 @@ class Downloader:
         # If we got here, it wasn't found
         return None
 
+    def _start_progress(self, total_size, bytes_so_far=0):
+        # Starts drawing the progress bar and returns a tuple of the
+        # (queue, worker) to send packets to
+        if self.use_process:
+            queue = multiprocessing.Queue()
+            # Create the multiprocess
+            worker = multiprocessing.Process(
+                target=_process_hook,
+                args=(queue,total_size,bytes_so_far)
+            )
+            # Filthy hack for earlier python versions on Windows
+            if os.name == "nt" and hasattr(multiprocessing,"forking"):
+                self._update_main_name()
+        else:
+            # A thread avoids spawning (and re-importing) a whole
+            # interpreter just to draw the bar
+            queue = q.Queue()
+            worker = threading.Thread(
+                target=_process_hook,
+                args=(queue,total_size,bytes_so_far),
+                kwargs={"redraw_interval":self.redraw_interval}
+            )
+        worker.daemon = True
+        worker.start()
+        return (queue,worker)
+
+    def _stop_progress(self, queue, worker):
+        # Finalize the queue and wait
+        queue.put("DONE")
+        worker.join()
+
     def _get_headers(self, headers = None):
         # Fall back on the default ua if none provided
         target = headers if isinstance(headers,dict) else self.ua
@@ -204,11 +256,21 @@ class Downloader:
             new_headers[k] = target[k]
         return new_headers
 
-    def open_url(self, url, headers = None):
+    def open_url(self, url, headers = None, method = None):
         headers = self._get_headers(headers)
+        request = Request(url, headers=headers)
+        if method:
+            # Request only takes a method on py3 - override it directly
+            request.get_method = lambda: method
         # Wrap up the try/except block so we don't have to do this for each function
         try:
-            response = urlopen(Request(url, headers=headers), context=self.ssl_context)
+            response = urlopen(request, context=self.ssl_context)
+        except HTTPError as e:
+            # A 304 is only sent in reply to a conditional request - hand it
+            # back so the caller knows their copy is still current
+            if e.code == 304:
+                return e
+            return None
         except Exception as e:
             # No fixing this - bail
             return None
@@ -227,22 +289,17 @@ class Downloader:
         if response is None: return None
         try: total_size = int(response.headers['Content-Length'])
         except: total_size = -1
-        chunk_so_far = b""
-        packets = queue = process = None
+        # Expand gzip encoded data as it arrives rather than holding the
+        # compressed copy and expanding it all at the end
+        decompressor = None
+        if expand_gzip and response.headers.get("Content-Encoding","unknown").lower() == "gzip":
+            decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+        # BytesIO grows in amortized constant time, and getvalue() hands
+        # back its buffer without another copy where possible
+        chunk_so_far = BytesIO()
+        queue = process = None
         if progress:
-            # Make sure our vars are initialized
-            packets = [] if progress else None
-            queue = multiprocessing.Queue()
-            # Create the multiprocess and start it
-            process = multiprocessing.Process(
-                target=_process_hook,
-                args=(queue,total_size)
-            )
-            process.daemon = True
-            # Filthy hack for earlier python versions on Windows
-            if os.name == "nt" and hasattr(multiprocessing,"forking"):
-                self._update_main_name()
-            process.start()
+            queue,process = self._start_progress(total_size)
         try:
             while True:
                 chunk = response.read(self.chunk)
@@ -250,27 +307,54 @@ class Downloader:
                     # Add our items to the queue
                     queue.put((time.time(),len(chunk)))
                 if not chunk: break
-                chunk_so_far += chunk
+                if decompressor:
+                    chunk = decompressor.decompress(chunk)
+                chunk_so_far.write(chunk)
+            if decompressor:
+                chunk_so_far.write(decompressor.flush())
         finally:
             # Close the response whenever we're done
             response.close()
-        if expand_gzip and response.headers.get("Content-Encoding","unknown").lower() == "gzip":
-            fileobj = BytesIO(chunk_so_far)
-            gfile   = gzip.GzipFile(fileobj=fileobj)
-            return gfile.read()
+            if progress:
+                self._stop_progress(queue,process)
+        return chunk_so_far.getvalue()
+
+    def iter_chunks(self, url, progress = True, headers = None, response = None):
+        # Yields the body of the response in self.chunk sized pieces as
+        # they arrive.  An already opened response for the url can be
+        # passed to avoid requesting it again.
+        if response is None:
+            response = self.open_url(url, headers)
+        if response is None: return
+        try: total_size = int(response.headers['Content-Length'])
+        except: total_size = -1
+        queue = process = None
         if progress:
-            # Finalize the queue and wait
-            queue.put("DONE")
-            process.join()
-        return chunk_so_far
+            queue,process = self._start_progress(total_size)
+        try:
+            while True:
+                chunk = response.read(self.chunk)
+                if progress:
+                    # Add our items to the queue
+                    queue.put((time.time(),len(chunk)))
+                if not chunk: break
+                yield chunk
+        finally:
+            # Close the response whenever we're done
+            response.close()
+            if progress:
+                self._stop_progress(queue,process)
 
-    def stream_to_file(self, url, file_path, progress = True, headers = None, ensure_size_if_present = True, allow_resume = False):
-        response = self.open_url(url, headers)
+    def stream_to_file(self, url, file_path, progress = True, headers = None, ensure_size_if_present = True, allow_resume = False, response = None):
+        # An already opened response for the url can be passed to avoid
+        # requesting it again
+        if response is None:
+            response = self.open_url(url, headers)
         if response is None: return None
         bytes_so_far = 0
         try: total_size = int(response.headers['Content-Length'])
         except: total_size = -1
-        packets = queue = process = None
+        queue = process = None
         mode = "wb"
         if allow_resume and os.path.isfile(file_path) and total_size != -1:
             # File exists, we're resuming and have a target size.  Check the
@@ -293,19 +377,7 @@ class Downloader:
                 response = self.open_url(url, new_headers)
                 if response is None: return None
         if progress:
-            # Make sure our vars are initialized
-            packets = [] if progress else None
-            queue = multiprocessing.Queue()
-            # Create the multiprocess and start it
-            process = multiprocessing.Process(
-                target=_process_hook,
-                args=(queue,total_size,bytes_so_far)
-            )
-            process.daemon = True
-            # Filthy hack for earlier python versions on Windows
-            if os.name == "nt" and hasattr(multiprocessing,"forking"):
-                self._update_main_name()
-            process.start()
+            queue,process = self._start_progress(total_size,bytes_so_far)
         with open(file_path,mode) as f:
             try:
                 while True:
@@ -320,9 +392,7 @@ class Downloader:
                 # Close the response whenever we're done
                 response.close()
         if progress:
-            # Finalize the queue and wait
-            queue.put("DONE")
-            process.join()
+            self._stop_progress(queue,process)
         if ensure_size_if_present and total_size != -1:
             # We're verifying size - make sure we got what we asked for
             if bytes_so_far != total_size:
@@ -1,16 +1,90 @@
-import os, sys, binascii, json, gzip
+import os, sys, re, bisect, binascii, json, gzip, zlib, hashlib, marshal, mmap
 from . import run
 
+class IORegNode:
+    # Lightweight node built by IOReg._parse_ioreg() - one per "+-o " header
+    __slots__ = (
+        "index",       # Position in the plane's node list
+        "name",        # NAME@ADDR as shown in the header
+        "clss",        # Class name from <class X, ...>, or None
+        "pad",         # Indentation of the "+-o " marker
+        "parent",      # Enclosing IORegNode based on indentation, or None
+        "line",        # Index of the header line
+        "start",       # Index of the first line of the property block
+        "end",         # Index of the closing } line (exclusive)
+        "acpi_parent", # Previous IOPCIDevice/IOACPIPlatformDevice in the walked path
+        "acpi_node",   # Node whose walked path applies to this one
+        "acpi_path",   # Cached walked path string
+        "uid"          # Raw "_UID" value from the property block, or None
+    )
+
+    def __init__(self, index, name, clss, pad, parent, line):
+        self.index = index
+        self.name = name
+        self.clss = clss
+        self.pad = pad
+        self.parent = parent
+        self.line = line
+        self.start = self.end = line+1
+        self.acpi_parent = self.acpi_node = self.acpi_path = self.uid = None
+
+    def __repr__(self):
+        return "<IORegNode {} ({})>".format(self.name,self.clss)
+
 class IOReg:
     def __init__(self):
         self.ioreg = {}
+        self.ioreg_tree = {}
+        # Matches ioreg -a data that ioreg -l would show as strings
+        self.ioreg_strings_re = re.compile(b"^(?:[\x20-\x7e]+\x00)+$")
+        # Registry info ioreg -a adds to each entry alongside its properties
+        self.ioreg_archive_meta = set((
+            "IORegistryEntryChildren",
+            "IORegistryEntryName",
+            "IORegistryEntryLocation",
+            "IORegistryEntryID",
+            "IOObjectClass",
+            "IOObjectRetainCount",
+            "IOServiceBusyState",
+            "IOServiceBusyTime",
+            "IOServiceState"
+        ))
         self.pci_devices = []
+        # system_profiler entries keyed by their normalized ids - rebuilt
+        # whenever the list it was built from is replaced
+        self.pci_devices_index = None
+        self.pci_device_keys = (
+            "vendor-id",
+            "device-id",
+            "subsystem-vendor-id",
+            "subsystem-id"
+        )
         self.r = run.Run()
         self.d = None # Placeholder
         # Placeholder for a local pci.ids file.  You can get it from: https://pci-ids.ucw.cz/
         # and place it next to this file
         self.pci_ids_url = "https://pci-ids.ucw.cz"
+        self.pci_ids_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"pci.ids")
+        # Compiled copy of the parsed pci.ids(.gz) - rebuilt whenever the
+        # source file's size, mtime, or hash changes
+        self.pci_ids_cache_path = self.pci_ids_path+".cache"
+        self.pci_ids_cache_version = 1
+        # ETag/Last-Modified info used to skip unchanged downloads
+        self.pci_ids_validators_path = self.pci_ids_path+".validators"
         self.pci_ids = {}
+        # When enabled, an uncompressed pci.ids is memory-mapped and only
+        # the vendor/class blocks we're asked about get parsed.  The
+        # offsets of each block are kept in pci.ids.index.  Off by default
+        # so lookups use the compiled cache above - it's worth enabling
+        # when only a handful of lookups are made per process.
+        self.pci_ids_lazy = False
+        self.pci_ids_index_path = self.pci_ids_path+".index"
+        # Where pci.ids.gz is expanded for the lazy lookups - a local
+        # pci.ids is never overwritten
+        self.pci_ids_expanded_path = self.pci_ids_path+".expanded"
+        self.pci_ids_header_re = re.compile(br"^(?:C ([0-9a-fA-F]{2})|([0-9a-fA-F]{4}))  ",re.M)
+        self.pci_ids_index = None
+        self.pci_ids_blocks = {}
 
     def _get_hex_addr(self,item):
         # Attempts to reformat an item from NAME@X,Y to NAME@X000000Y
@@ -57,29 +131,21 @@ class IOReg:
     def _get_pcix_uid(self,item,allow_fallback=True,fallback_uid=0,plane="IOService",force=False):
         # Helper to look for the passed item's _UID
         # Expects a XXXX@Y style string
-        self.get_ioreg(plane=plane,force=force)
-        # Ensure our item ends with 2 spaces
-        item = item.rstrip()+"  "
-        item_uid = None
-        found_device = False
-        for line in self.ioreg[plane]:
-            if item in line:
-                found_device = True
-                continue
-            if not found_device:
-                continue # Haven't found it yet
-            # We have the device here - let's look for _UID or a closing
-            # curly bracket
-            if line.replace("|","").strip() == "}":
-                break # Bail on the loop
-            elif '"_UID" = "' in line:
-                # Got a _UID - let's rip it
+        tree = self.get_ioreg_tree(plane=plane,force=force)
+        item = item.strip()
+        if item in tree["pci_roots"]:
+            # Collected while parsing
+            item_uid = tree["pci_roots"][item]
+        else:
+            item_uid = None
+            node = next(iter(tree["names"].get(item,[])),None)
+            if node and node.uid is not None:
                 try:
-                    item_uid = int(line.split('"_UID" = "')[1].split('"')[0])
+                    item_uid = int(node.uid)
                 except:
                     # Some _UIDs are strings - but we won't accept that here
                     # as we're ripping it specifically for PciRoot/Pci pathing
-                    break
+                    pass
         if item_uid is None and allow_fallback:
             return fallback_uid
         return item_uid
@@ -89,26 +155,353 @@ class IOReg:
             self.ioreg[plane] = self.r.run({"args":["ioreg", "-lw0", "-p", plane]})[0].split("\n")
         return self.ioreg[plane]
 
+    def prefetch(self,planes=None,pci_devices=False,force=False,max_workers=4):
+        # Captures the passed ioreg planes - and optionally the
+        # system_profiler PCI info - at the same time instead of
+        # one after another.  Anything already gathered is skipped
+        # unless force is set.
+        planes = [p for p in (planes or []) if force or not self.ioreg.get(p,None)]
+        commands = [{"args":["ioreg", "-lw0", "-p", p]} for p in planes]
+        if pci_devices and (force or not self.pci_devices):
+            commands.append({"args":["system_profiler","SPPCIDataType","-json"]})
+        if not commands:
+            return
+        outs = self.r.run(commands,concurrent=True,max_workers=max_workers)
+        if len(commands) == 1:
+            outs = [outs]
+        for plane,out in zip(planes,outs):
+            self.ioreg[plane] = out[0].split("\n")
+        if len(outs) > len(planes):
+            self.pci_devices = self._load_pci_devices(outs[-1][0])
+
+    def get_ioreg_tree(self,plane="IOService",force=False):
+        # Returns the parsed node tree for the passed plane, only
+        # tokenizing the ioreg lines again if they were replaced
+        lines = self.get_ioreg(plane=plane,force=force)
+        tree = self.ioreg_tree.get(plane)
+        if force or not tree or tree["source"] is not lines or tree["count"] != len(lines):
+            if isinstance(lines,dict):
+                # Loaded from an ioreg -a archive
+                tree = self._parse_ioreg_archive(lines)
+            else:
+                tree = self._parse_ioreg(lines)
+            self.ioreg_tree[plane] = tree
+        return tree
+
+    def _parse_ioreg(self,lines):
+        # Walks the ioreg lines exactly once and builds a list of nodes
+        # in the order they appear.  Each node retains its indentation,
+        # its parent, and the offsets of its property block so queries
+        # never need to rescan the raw lines.
+        nodes = []
+        names = {}
+        names_no_addr = {}
+        classes = {}
+        stack = []
+        acpi_stack = []
+        acpi_classes = ("IOPCIDevice","IOACPIPlatformDevice")
+        pci_roots = {}
+        node = None
+        in_block = False
+        for i,line in enumerate(lines):
+            x = line.find("+-o ")
+            if x < 0:
+                if not in_block:
+                    continue
+                # Check for a lone closing curly brace to denote the
+                # end of the property block
+                s = line.rstrip()
+                if s.endswith("}") and s.replace("|","").strip() == "}":
+                    node.end = i
+                    in_block = False
+                elif '"_UID" = "' in line:
+                    node.uid = line.split('"_UID" = "')[1].split('"')[0]
+                elif "PNP0A0" in line and ("PNP0A03" in line or "PNP0A08" in line) \
+                and ('"compatible" = ' in line or '"name" = ' in line):
+                    # PCI roots use PNP0A03 or PNP0A08 in either name
+                    # or compatible - keep them for _UID lookups
+                    pci_roots.setdefault(node.name,node)
+                continue
+            if in_block:
+                # Never closed - end the prior block here
+                node.end = i
+            rest = line[x+4:]
+            clss = rest.split("<class ")[1].split(",")[0] if "<class " in rest else None
+            # Ensure we're keeping track of scope
+            while stack and stack[-1].pad >= x:
+                stack.pop()
+            node = IORegNode(len(nodes),rest.split("  ")[0],clss,x,stack[-1] if stack else None,i)
+            nodes.append(node)
+            stack.append(node)
+            # Index the node by name, name without address, and class
+            names.setdefault(node.name,[]).append(node)
+            names_no_addr.setdefault(node.name.split("@")[0],[]).append(node)
+            if clss is not None:
+                classes.setdefault(clss,[]).append(node)
+            # Mirror the scoping rules of _walk_path() so each node
+            # can resolve its path without walking backward
+            if clss in acpi_classes:
+                while acpi_stack and acpi_stack[-1].pad >= x:
+                    acpi_stack.pop()
+                node.acpi_parent = acpi_stack[-1] if acpi_stack else None
+                node.acpi_node = node
+                acpi_stack.append(node)
+            elif acpi_stack:
+                node.acpi_node = acpi_stack[-1]
+            in_block = True
+        if in_block:
+            node.end = len(lines)
+        # Resolve the _UID of each PCI root - they're used when building
+        # device paths, so there's no need to rescan for them later
+        # Keyed by both the NAME@X,Y and NAME@X000000Y forms as
+        # the latter is what _walk_path() produces
+        for name,node in list(pci_roots.items()):
+            try:
+                _uid = int(node.uid)
+            except:
+                _uid = None
+            pci_roots[name] = _uid
+            pci_roots.setdefault(self._get_hex_addr(name),_uid)
+        return {
+            "source":lines,
+            "lines":lines,
+            "count":len(lines),
+            "nodes":nodes,
+            "names":names,
+            "names_no_addr":names_no_addr,
+            "classes":classes,
+            "pci_roots":pci_roots,
+            "acpi_paths":None, # Built on first use
+            "headers":None # Built on first use
+        }
+
+    def _format_ioreg_value(self,value):
+        # Renders a value loaded from an ioreg -a archive the same way
+        # ioreg -l prints it, so the rest of the parsing doesn't need
+        # to care which format the dump came from
+        if isinstance(value,bytes) and not isinstance(value,str):
+            data = value
+        elif isinstance(value,(str,type(u""))):
+            return '"{}"'.format(value)
+        elif isinstance(value,bool):
+            return "Yes" if value else "No"
+        elif isinstance(value,(int,float)):
+            return str(value)
+        elif isinstance(value,dict):
+            return "{"+",".join('"{}"={}'.format(k,self._format_ioreg_value(v)) for k,v in value.items())+"}"
+        elif isinstance(value,(list,tuple)):
+            return "("+",".join(self._format_ioreg_value(v) for v in value)+")"
+        else:
+            # Data is wrapped in plistlib.Data on py2
+            data = getattr(value,"data",None)
+        if isinstance(data,bytes):
+            # Data that's entirely null terminated, printable strings is
+            # shown as <"a","b"> - anything else as <hex>
+            if self.ioreg_strings_re.match(data):
+                return '<"'+'","'.join(data[:-1].decode().split("\x00"))+'">'
+            return "<"+binascii.hexlify(data).decode()+">"
+        return '"{}"'.format(value)
+
+    def _parse_ioreg_archive(self,root):
+        # Builds the same tree as _parse_ioreg() from the plist loaded
+        # from an ioreg -a dump by walking the IORegistryEntryChildren
+        # of each entry.  Each node keeps its entry in place of a property
+        # block, and a header line is synthesized for each so anything
+        # looking at the lines still works.
+        lines = []
+        entries = []
+        nodes = []
+        names = {}
+        names_no_addr = {}
+        classes = {}
+        acpi_stack = []
+        acpi_classes = ("IOPCIDevice","IOACPIPlatformDevice")
+        pci_roots = {}
+        # ioreg -a -r dumps are an array of entries rather than the root
+        # entry - those get wrapped in a nameless container by the caller
+        if "IORegistryEntryName" in root:
+            todo = [(root,0,None)]
+        else:
+            todo = [(x,0,None) for x in root.get("IORegistryEntryChildren",[])[::-1]]
+        while todo:
+            entry,x,parent = todo.pop()
+            if not isinstance(entry,dict):
+                continue
+            name = entry.get("IORegistryEntryName","")
+            if entry.get("IORegistryEntryLocation"):
+                name += "@"+entry["IORegistryEntryLocation"]
+            clss = entry.get("IOObjectClass")
+            node = IORegNode(len(nodes),name,clss,x,parent,len(lines))
+            node.start = node.end = len(lines)+1
+            lines.append("{}+-o {}  <class {}, id 0x{:x}, retain {}>".format(
+                " "*x,name,clss,entry.get("IORegistryEntryID",0),entry.get("IOObjectRetainCount",0)
+            ))
+            entries.append(entry)
+            nodes.append(node)
+            names.setdefault(name,[]).append(node)
+            names_no_addr.setdefault(name.split("@")[0],[]).append(node)
+            if clss is not None:
+                classes.setdefault(clss,[]).append(node)
+            if clss in acpi_classes:
+                while acpi_stack and acpi_stack[-1].pad >= x:
+                    acpi_stack.pop()
+                node.acpi_parent = acpi_stack[-1] if acpi_stack else None
+                node.acpi_node = node
+                acpi_stack.append(node)
+            elif acpi_stack:
+                node.acpi_node = acpi_stack[-1]
+            # Only format what's needed to find the PCI roots here - the
+            # rest are formatted as they're asked for
+            if "_UID" in entry:
+                node.uid = self._format_ioreg_value(entry["_UID"]).strip('"')
+            if "compatible" in entry or "name" in entry:
+                pnp = "".join(self._format_ioreg_value(entry[k]) for k in ("compatible","name") if k in entry)
+                if "PNP0A03" in pnp or "PNP0A08" in pnp:
+                    pci_roots.setdefault(name,node)
+            # Children are indented 2 more than their parent, as in the
+            # text output - push them reversed to keep their order
+            children = entry.get("IORegistryEntryChildren")
+            if isinstance(children,list):
+                todo.extend((c,x+2,node) for c in children[::-1])
+        for name,node in list(pci_roots.items()):
+            try:
+                _uid = int(node.uid)
+            except:
+                _uid = None
+            pci_roots[name] = _uid
+            pci_roots.setdefault(self._get_hex_addr(name),_uid)
+        return {
+            "source":root,
+            "lines":lines,
+            "count":len(root),
+            "entries":entries,
+            "nodes":nodes,
+            "names":names,
+            "names_no_addr":names_no_addr,
+            "classes":classes,
+            "pci_roots":pci_roots,
+            "acpi_paths":None, # Built on first use
+            "headers":None # Built on first use
+        }
+
+    def _get_acpi_path_index(self,tree):
+        # Maps each walked path to the IOPCIDevice/IOACPIPlatformDevice
+        # nodes that resolve to it
+        if tree["acpi_paths"] is None:
+            acpi_paths = {}
+            for node in tree["nodes"]:
+                if node.acpi_node is node:
+                    acpi_paths.setdefault(self._get_node_acpi_path(node),[]).append(node)
+            tree["acpi_paths"] = acpi_paths
+        return tree["acpi_paths"]
+
+    def _get_headers(self,tree):
+        # All of the node headers joined by newlines, the offset each
+        # starts at, and the results of any searches made so far
+        if tree["headers"] is None:
+            lines = tree["lines"]
+            offsets = []
+            offset = 0
+            for n in tree["nodes"]:
+                offsets.append(offset)
+                offset += len(lines[n.line])+1
+            tree["headers"] = {
+                "text":"\n".join(lines[n.line] for n in tree["nodes"]),
+                "offsets":offsets,
+                "found":{}
+            }
+        return tree["headers"]
+
+    def _iter_header_nodes(self,tree,search):
+        # Yields the nodes whose header contains the passed search in the
+        # order they appear - stopping as soon as the caller does
+        if not search or "\n" in search:
+            return
+        headers = self._get_headers(tree)
+        text,offsets,nodes = headers["text"],headers["offsets"],tree["nodes"]
+        pos = text.find(search)
+        while pos != -1:
+            i = bisect.bisect_right(offsets,pos)-1
+            yield nodes[i]
+            if i+1 >= len(offsets):
+                break
+            # Pick up from the next header
+            pos = text.find(search,offsets[i+1])
+
+    def _find_nodes(self,tree,search,lazy=False):
+        # Returns the nodes whose header contains the passed search in the
+        # order they appear, as a substring scan of each header would.
+        # Results are kept per tree so repeat searches are a single dict
+        # hit.  Full ACPI paths are also resolved from their index.  With
+        # lazy set, an uncached search is returned as a generator so
+        # callers only after the first match can stop early.
+        found = self._get_headers(tree)["found"]
+        if search in found:
+            return found[search]
+        if lazy and not search.startswith("/"):
+            return self._iter_header_nodes(tree,search)
+        nodes = list(self._iter_header_nodes(tree,search))
+        if search.startswith("/"):
+            nodes = sorted(set(nodes).union(self._get_acpi_path_index(tree).get(search,[])),key=lambda n:n.index)
+        found[search] = nodes
+        return nodes
+
+    def _get_node_props(self,tree,node):
+        # Builds a dict of the raw "key" = value pairs for the node
+        if "entries" in tree:
+            # Loaded from an archive - format the entry's own properties
+            meta = self.ioreg_archive_meta
+            fmt = self._format_ioreg_value
+            return {k:fmt(v) for k,v in tree["entries"][node.index].items() if not k in meta}
+        props = {}
+        for line in tree["lines"][node.start:node.end]:
+            try:
+                name = line.split(" = ")[0].split('"')[1]
+                props[name] = line.split(" = ")[1]
+            except:
+                pass
+        return props
+
+    def _get_node_acpi_path(self,node):
+        # Returns the same path _walk_path() would build for this node
+        if node is None or node.acpi_node is None:
+            return ""
+        node = node.acpi_node
+        # Gather the uncached portion of the chain
+        chain = []
+        while node is not None and node.acpi_path is None:
+            chain.append(node)
+            node = node.acpi_parent
+        path = "" if node is None else node.acpi_path
+        for n in chain[::-1]:
+            path = n.acpi_path = path+"/"+self._get_hex_addr(n.name)
+        return path
+
     def get_pci_devices(self, force=False):
         # Uses system_profiler to build a list of connected
         # PCI devices
         if force or not self.pci_devices:
-            try:
-                self.pci_devices = json.loads(self.r.run({"args":[
-                    "system_profiler",
-                    "SPPCIDataType",
-                    "-json"
-                ]})[0])["SPPCIDataType"]
-                assert isinstance(self.pci_devices,list)
-            except:
-                # Failed - reset
-                self.pci_devices = []
+            self.pci_devices = self._load_pci_devices(self.r.run({"args":[
+                "system_profiler",
+                "SPPCIDataType",
+                "-json"
+            ]})[0])
         return self.pci_devices
 
+    def _load_pci_devices(self, output):
+        # Pulls the list of PCI devices from system_profiler's json output
+        try:
+            pci_devices = json.loads(output)["SPPCIDataType"]
+            assert isinstance(pci_devices,list)
+        except:
+            # Failed - reset
+            pci_devices = []
+        return pci_devices
+
     def _update_pci_ids_if_missing(self, quiet=True):
         # Checks for the existence of pci.ids or pci.ids.gz - and attempts
         # to download the latest if none is found.
-        pci_ids_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"pci.ids")
+        pci_ids_path = self.pci_ids_path
         pci_ids_gz_path = pci_ids_path+".gz"
         found = next((x for x in (pci_ids_path,pci_ids_gz_path) if os.path.isfile(x)),None)
         if found:
@@ -116,24 +509,63 @@ class IOReg:
         # Not found - try to update
         return self._update_pci_ids(quiet=quiet)
 
-    def _update_pci_ids(self, quiet=True):
+    def _load_pci_ids_validators(self):
+        # Returns the url, ETag, and Last-Modified values saved alongside
+        # our last download - if the file they describe still exists
+        try:
+            with open(self.pci_ids_validators_path,"r") as f:
+                validators = json.load(f)
+            assert isinstance(validators,dict)
+            assert os.path.isfile(os.path.join(os.path.dirname(self.pci_ids_path),validators["file"]))
+            return validators
+        except:
+            return {}
+
+    def _save_pci_ids_validators(self, dl_url, target_path, response):
+        try:
+            headers = response.info()
+            with open(self.pci_ids_validators_path,"w") as f:
+                json.dump({
+                    "url":dl_url,
+                    "file":os.path.basename(target_path),
+                    "etag":headers.get("ETag"),
+                    "last_modified":headers.get("Last-Modified")
+                },f,indent=2)
+        except:
+            pass
+
+    def _open_pci_ids_url(self, qprint, method=None):
+        # Opens the pci.ids.gz download - conditionally if we have
+        # validators for the local copy.  The method can be set to HEAD
+        # to only gather the headers.  Returns a tuple of the
+        # (url, response), or (None, None) on failure.
         if self.d is None:
             try:
                 # Only initialize if we're actually using it
                 from . import downloader
                 self.d = downloader.Downloader()
             except:
-                return None
-        def qprint(text):
-            if quiet: return
-            print(text)
+                return (None,None)
+        validators = self._load_pci_ids_validators()
+        headers = self.d._get_headers()
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        if validators.get("url"):
+            # Try where we got it last time first - this lets us skip
+            # the index page entirely
+            qprint("Checking {}...".format(validators["url"]))
+            response = self.d.open_url(validators["url"],headers=headers,method=method)
+            if response is not None:
+                return (validators["url"],response)
         qprint("Gathering latest info from {}...".format(self.pci_ids_url))
         try:
             _html = self.d.get_string(self.pci_ids_url,progress=False)
             assert _html
         except:
             qprint(" - Something went wrong")
-            return None
+            return (None,None)
         # Try to scrape for the .gz compressed download link
         qprint("Locating download URL...")
         dl_url = None
@@ -150,49 +582,282 @@ class IOReg:
                     continue
         if not dl_url:
             qprint(" - Not located")
+            return (None,None)
+        qprint(" - {}".format(dl_url))
+        if dl_url != validators.get("url"):
+            # Validators only apply to the url they came from
+            headers = self.d._get_headers()
+        response = self.d.open_url(dl_url,headers=headers,method=method)
+        if response is None:
+            qprint(" - Something went wrong")
+            return (None,None)
+        return (dl_url,response)
+
+    def _check_pci_ids(self, quiet=True):
+        # Reports whether the local pci.ids.gz is current without
+        # downloading it - only the headers are requested.  Returns True
+        # if up to date, False if an update would be downloaded, or None
+        # if we couldn't tell.
+        def qprint(text):
+            if quiet: return
+            print(text)
+        dl_url,response = self._open_pci_ids_url(qprint,method="HEAD")
+        if response is None:
+            return None
+        response.close()
+        if response.getcode() == 304:
+            qprint(" - Local copy is up to date")
+            return True
+        # No validators saved, or the server ignored them - compare the
+        # headers with the local copy instead
+        target_path = os.path.join(os.path.dirname(self.pci_ids_path),os.path.basename(dl_url))
+        current = self._pci_ids_matches_headers(target_path,response.info())
+        if current is None:
+            qprint(" - Could not compare with the local copy")
+        elif current:
+            qprint(" - Local copy is up to date")
+        else:
+            qprint(" - An update is available")
+        return current
+
+    def _pci_ids_matches_headers(self, path, headers):
+        # Compares the Content-Length and Last-Modified headers for a
+        # download with the local copy at the passed path.  Returns True
+        # if they match, False if they don't, or None if there's nothing
+        # to compare.
+        if not os.path.isfile(path):
+            return False
+        size = headers.get("Content-Length")
+        modified = headers.get("Last-Modified")
+        if not size and not modified:
+            return None
+        try:
+            if size and int(size) != os.path.getsize(path):
+                return False
+        except ValueError:
+            size = None
+        if modified:
+            import email.utils
+            try:
+                modified = email.utils.mktime_tz(email.utils.parsedate_tz(modified))
+            except:
+                modified = None
+            if modified is not None and modified > os.path.getmtime(path):
+                # Changed upstream since we saved ours
+                return False
+        if not size and modified is None:
             return None
+        return True
+
+    def _stream_pci_ids(self, dl_url, response, gz_path, progress=False):
+        # Pipes the pci.ids.gz download through an incremental decompressor
+        # and straight into the line parser.  The .gz, the expanded copy,
+        # the compiled cache, and the block index are all written in that
+        # single pass.  Returns gz_path on success, None otherwise.
+        try: total_size = int(response.headers["Content-Length"])
+        except: total_size = -1
+        plain_path = self.pci_ids_expanded_path
+        gz_hash,plain_hash = hashlib.sha1(),hashlib.sha1()
+        decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+        headers = []
+        state = {"received":0,"offset":0}
+        def get_lines(gz_file,plain_file):
+            pending = b""
+            chunks = self.d.iter_chunks(dl_url,progress=progress,response=response)
+            while True:
+                chunk = next(chunks,None)
+                if chunk is None:
+                    data = decompressor.flush()
+                else:
+                    state["received"] += len(chunk)
+                    gz_file.write(chunk)
+                    gz_hash.update(chunk)
+                    data = decompressor.decompress(chunk)
+                plain_file.write(data)
+                plain_hash.update(data)
+                parts = (pending+data).split(b"\n")
+                # Hold onto any partial line until the next chunk
+                pending = parts.pop() if chunk is not None else b""
+                for part in parts:
+                    # Keep track of each vendor/class block's offset
+                    if part[:1] not in (b"\t",b"#",b"",b"\r"):
+                        m = self.pci_ids_header_re.match(part)
+                        if m and m.group(1):
+                            headers.append((state["offset"],"classes",int(m.group(1),16)))
+                        elif m:
+                            headers.append((state["offset"],"devices",int(m.group(2),16)))
+                    state["offset"] += len(part)+1
+                    yield part.decode(errors="ignore").replace("\r","")
+                if chunk is None:
+                    break
+        try:
+            # The expanded copy is closed last so it's never considered
+            # older than the .gz
+            with open(plain_path+".tmp","wb") as plain_file:
+                with open(gz_path+".tmp","wb") as gz_file:
+                    pci_ids = self._parse_pci_ids(get_lines(gz_file,plain_file))
+            assert pci_ids
+            assert total_size == -1 or state["received"] == total_size
+            # Swap the new copies in
+            for path in (gz_path,plain_path):
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(path+".tmp",path)
+        except:
+            for path in (gz_path,plain_path):
+                try: os.remove(path+".tmp")
+                except: pass
+            return None
+        # Save the compiled cache and the block index without rereading
+        # either file
+        self.pci_ids = pci_ids
+        self.pci_ids_index = None
+        self.pci_ids_blocks = {}
+        self._save_pci_ids_cache(self._get_pci_ids_cache_key(gz_path,gz_hash.hexdigest()),pci_ids)
+        self._build_pci_ids_index(
+            self._get_pci_ids_cache_key(plain_path,plain_hash.hexdigest()),
+            headers,
+            state["offset"]-1 if state["offset"] else 0
+        )
+        return gz_path
+
+    def _update_pci_ids(self, quiet=True):
+        def qprint(text):
+            if quiet: return
+            print(text)
+        dl_url,response = self._open_pci_ids_url(qprint)
+        if response is None:
+            return None
+        target_path = os.path.join(os.path.dirname(self.pci_ids_path),os.path.basename(dl_url))
+        if response.getcode() == 304:
+            # Nothing changed upstream - no need to download it again
+            response.close()
+            qprint(" - Local copy is up to date: {}".format(target_path))
+            return target_path
         # Got a download URL - let's actually download it
-        qprint(" - {}".format(dl_url))
         qprint("Downloading {}...".format(os.path.basename(dl_url)))
-        target_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),os.path.basename(dl_url))
+        streamed = target_path == self.pci_ids_path+".gz"
         try:
-            saved_file = self.d.stream_to_file(dl_url,target_path,progress=not quiet)
+            if streamed:
+                # Expand, parse, and compile as it downloads
+                saved_file = self._stream_pci_ids(dl_url,response,target_path,progress=not quiet)
+            else:
+                saved_file = self.d.stream_to_file(dl_url,target_path,progress=not quiet,response=response)
         except:
             qprint(" - Something went wrong")
             return None
-        if os.path.isfile(target_path):
+        if saved_file and os.path.isfile(target_path):
             qprint("\nSaved to: {}".format(target_path))
+            self._save_pci_ids_validators(dl_url,target_path,response)
+            if not streamed:
+                # Rebuild the compiled cache from the new copy, and make
+                # sure the lazy lookups pick it up as well
+                self.pci_ids_index = None
+                self._get_pci_ids_dict(force=True)
             return target_path
         qprint("Download failed.")
         return None
 
+    def _get_pci_ids_cache_key(self, path, digest=None):
+        # Identifies the exact source file (and Python version, as the
+        # marshal format is version specific) a compiled cache belongs to
+        st = os.stat(path)
+        if digest is None:
+            with open(path,"rb") as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+        return (
+            self.pci_ids_cache_version,
+            tuple(sys.version_info[:2]),
+            os.path.basename(path),
+            st.st_size,
+            int(st.st_mtime),
+            digest
+        )
+
+    def _load_pci_ids_cache(self, key):
+        try:
+            with open(self.pci_ids_cache_path,"rb") as f:
+                # Read it all up front - marshal.load() pulls from file
+                # objects in tiny increments
+                cache = marshal.loads(f.read())
+            if cache.get("key") == key and isinstance(cache.get("pci_ids"),dict):
+                return cache["pci_ids"]
+        except:
+            pass
+        return None
+
+    def _save_marshal(self, path, value):
+        # Write to a temp file first so an interrupted save never leaves
+        # a truncated file behind
+        temp_path = path+".tmp"
+        try:
+            with open(temp_path,"wb") as f:
+                f.write(marshal.dumps(value))
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path,path)
+        except:
+            # Not fatal - we just won't have a cache next time
+            try: os.remove(temp_path)
+            except: pass
+            return False
+        return True
+
+    def _save_pci_ids_cache(self, key, pci_ids):
+        return self._save_marshal(self.pci_ids_cache_path,{"key":key,"pci_ids":pci_ids})
+
+    def _build_pci_ids_index(self, key, headers, size):
+        # Takes a list of (offset, "devices"/"classes", id) tuples for each
+        # top-level line - each block runs until the next one starts
+        index = {"key":key,"devices":{},"classes":{}}
+        for i,(start,k,_id) in enumerate(headers):
+            end = headers[i+1][0] if i+1 < len(headers) else size
+            index[k][_id] = (start,end)
+        self._save_marshal(self.pci_ids_index_path,index)
+        return index
+
+    def _read_pci_ids_lines(self, path):
+        # Returns the decoded lines of the passed pci.ids or pci.ids.gz
+        try:
+            if path.lower().endswith(".gz"):
+                data = gzip.open(path).read()
+            else:
+                with open(path,"rb") as f:
+                    data = f.read()
+            return data.decode(errors="ignore").replace("\r","").split("\n")
+        except:
+            return None
+
     def _get_pci_ids_dict(self, force=False):
         if self.pci_ids and not force:
             return self.pci_ids
         self.pci_ids = {}
         # Hasn't already been processed - see if it exists, and load it if so
-        pci_ids_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"pci.ids")
-        pci_ids_gz_path = pci_ids_path+".gz"
-        pci_ids = None
-        if os.path.isfile(pci_ids_gz_path):
-            # Prioritize the gzip file if found
-            try:
-                pci_ids = gzip.open(pci_ids_gz_path) \
-                .read().decode(errors="ignore").replace("\r","") \
-                .split("\n")
-            except:
-                pass
-        if not pci_ids and os.path.isfile(pci_ids_path):
-            # Try loading the file
+        # Prioritize the gzip file if found
+        for path in (self.pci_ids_path+".gz",self.pci_ids_path):
+            if not os.path.isfile(path):
+                continue
             try:
-                with open(pci_ids_path,"rb") as f:
-                    pci_ids = f.read().decode(errors="ignore") \
-                    .replace("\r","").split("\n")
+                key = self._get_pci_ids_cache_key(path)
             except:
-                pass
-        # Check again
-        if not pci_ids:
-            return self.pci_ids
+                continue
+            pci_ids = self._load_pci_ids_cache(key)
+            if pci_ids:
+                self.pci_ids = pci_ids
+                break
+            pci_ids = self._read_pci_ids_lines(path)
+            if not pci_ids:
+                continue
+            self.pci_ids = self._parse_pci_ids(pci_ids)
+            if self.pci_ids:
+                self._save_pci_ids_cache(key,self.pci_ids)
+                break
+        return self.pci_ids
+
+    def _parse_pci_ids(self, pci_ids, key="devices"):
+        # Walks the lines of a pci.ids file and builds out the nested
+        # vendor/device/subsystem and class/subclass/prog-if dicts
+        parsed = {}
         def get_id_name_from_line(line):
             # Helper to rip the id(s) out of the passed
             # line and convert to an int
@@ -208,7 +873,6 @@ class IOReg:
         # Walk our file and build out our dict
         _classes = False
         device = sub = None
-        key = "devices"
         for line in pci_ids:
             if line.strip().startswith("# List of known device classes"):
                 _classes = True
@@ -238,13 +902,92 @@ class IOReg:
                 # Got a vendor/class
                 try:
                     _id,name = get_id_name_from_line(line)
-                    if not key in self.pci_ids:
-                        self.pci_ids[key] = {}
-                    self.pci_ids[key][_id] = device = {"name":name}
+                    if not key in parsed:
+                        parsed[key] = {}
+                    parsed[key][_id] = device = {"name":name}
                 except:
                     device = sub = None
                     continue
-        return self.pci_ids
+        return parsed
+
+    def _get_pci_ids_plain_path(self):
+        # Returns the path to an uncompressed pci.ids.  The pci.ids.gz is
+        # preferred as it is elsewhere - it's expanded to its own file,
+        # and only again once the .gz is newer.  A local pci.ids is used
+        # as-is if there's no .gz.
+        gz = self.pci_ids_path+".gz"
+        if not os.path.isfile(gz):
+            return self.pci_ids_path if os.path.isfile(self.pci_ids_path) else None
+        expanded = self.pci_ids_expanded_path
+        try:
+            if not os.path.isfile(expanded) or os.stat(gz).st_mtime > os.stat(expanded).st_mtime:
+                temp_path = expanded+".tmp"
+                with open(temp_path,"wb") as f:
+                    with gzip.open(gz) as g:
+                        f.write(g.read())
+                if os.path.exists(expanded):
+                    os.remove(expanded)
+                os.rename(temp_path,expanded)
+        except:
+            try: os.remove(expanded+".tmp")
+            except: pass
+        return expanded if os.path.isfile(expanded) else None
+
+    def _get_pci_ids_index(self, force=False):
+        # Memory-maps the uncompressed pci.ids and returns a dict holding
+        # the map along with the (start, end) offsets of every vendor and
+        # class block, or None if that isn't possible.
+        if self.pci_ids_index is not None and not force:
+            return self.pci_ids_index or None
+        self.pci_ids_index = {} # Don't retry on failure
+        self.pci_ids_blocks = {}
+        path = self._get_pci_ids_plain_path()
+        if not path:
+            return None
+        try:
+            key = self._get_pci_ids_cache_key(path)
+            with open(path,"rb") as f:
+                pci_map = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        except:
+            return None
+        index = None
+        try:
+            with open(self.pci_ids_index_path,"rb") as f:
+                index = marshal.loads(f.read())
+            assert index.get("key") == key
+        except:
+            index = None
+        if index is None:
+            # Gather the offsets of every top-level vendor or class line
+            headers = []
+            for m in self.pci_ids_header_re.finditer(pci_map):
+                if m.group(1):
+                    headers.append((m.start(),"classes",int(m.group(1),16)))
+                else:
+                    headers.append((m.start(),"devices",int(m.group(2),16)))
+            index = self._build_pci_ids_index(key,headers,len(pci_map))
+        index["map"] = pci_map
+        self.pci_ids_index = index
+        return index
+
+    def _get_pci_ids_entry(self, key, _id):
+        # Returns the parsed vendor ("devices") or class ("classes") dict
+        # for the passed id - parsing only that block when we're lazy
+        if _id is None:
+            return {}
+        index = None
+        if self.pci_ids_lazy and not self.pci_ids:
+            index = self._get_pci_ids_index()
+        if not index:
+            return self._get_pci_ids_dict().get(key,{}).get(_id,{})
+        if not (key,_id) in self.pci_ids_blocks:
+            entry = {}
+            offsets = index[key].get(_id)
+            if offsets:
+                lines = index["map"][offsets[0]:offsets[1]].decode(errors="ignore").replace("\r","").split("\n")
+                entry = self._parse_pci_ids(lines,key=key).get(key,{}).get(_id,{})
+            self.pci_ids_blocks[(key,_id)] = entry
+        return self.pci_ids_blocks[(key,_id)]
 
     def get_device_info_from_pci_ids(self, device_dict):
         # Returns a dictionary containing the following info:
@@ -257,8 +1000,8 @@ class IOReg:
         #     "programming_interface":pi
         # }
         info = {}
-        pci_ids = self._get_pci_ids_dict()
-        if not pci_ids:
+        if not (self.pci_ids_lazy and not self.pci_ids and self._get_pci_ids_index()) \
+        and not self._get_pci_ids_dict():
             return info
         def normalize_id(_id):
             if not isinstance(_id,(int,str)):
@@ -281,11 +1024,12 @@ class IOReg:
         d  = normalize_id(device_dict.get("device-id"))
         sv = normalize_id(device_dict.get("subsystem-vendor-id"))
         si = normalize_id(device_dict.get("subsystem-id"))
-        device_info["vendor"] = pci_ids.get("devices",{}).get(v,{}).get("name")
-        device_info["device"] = pci_ids.get("devices",{}).get(v,{}).get(d,{}).get("name")
+        vendor = self._get_pci_ids_entry("devices",v)
+        device_info["vendor"] = vendor.get("name")
+        device_info["device"] = vendor.get(d,{}).get("name")
         if sv is not None and si is not None:
             sid = (sv << 16) + si
-            device_info["subsystem"] = pci_ids.get("devices",{}).get(v,{}).get(d,{}).get(sid)
+            device_info["subsystem"] = vendor.get(d,{}).get(sid)
         # Resolve our class-code to sub ids if possible
         cc = normalize_id(device_dict.get("class-code"))
         if cc is not None:
@@ -293,9 +1037,10 @@ class IOReg:
             c = cc >> 16 & 0xFFFF
             s = cc >> 8 & 0xFF
             p = cc & 0xFF
-            device_info["class"] = pci_ids.get("classes",{}).get(c,{}).get("name")
-            device_info["subclass"] = pci_ids.get("classes",{}).get(c,{}).get(s,{}).get("name")
-            device_info["programming_interface"] = pci_ids.get("classes",{}).get(c,{}).get(s,{}).get(p)
+            _class = self._get_pci_ids_entry("classes",c)
+            device_info["class"] = _class.get("name")
+            device_info["subclass"] = _class.get(s,{}).get("name")
+            device_info["programming_interface"] = _class.get(s,{}).get(p)
         return device_info
 
     def get_pci_device_name(self, device_dict, pci_devices=None, force=False, use_unknown=True, use_pci_ids=True):
@@ -309,44 +1054,53 @@ class IOReg:
             pci_dict = self.get_device_info_from_pci_ids(device_dict)
             if pci_dict and pci_dict.get("device"):
                 return pci_dict["device"]
-        # Compare the vendor-id, device-id, revision-id,
-        # subsystem-id, and subsystem-vendor-id if found
-        # The system_profiler output prefixes those with "sppci-"
-        def normalize_id(_id):
-            if not _id:
-                return None
-            if _id.startswith("<") and _id.endswith(">"):
-                _id = _id.strip("<>")
-                try:
-                    _id = binascii.hexlify(binascii.unhexlify(_id)[::-1]).decode()
-                except:
-                    return None
-            try:
-                return int(_id,16)
-            except:
-                return None
-        key_list = (
-            "vendor-id",
-            "device-id",
-            "subsystem-vendor-id",
-            "subsystem-id"
-        )
-        # Normalize the ids
-        d_keys = [normalize_id(device_dict.get(key)) for key in key_list]
+        # Compare the vendor-id, device-id, subsystem-vendor-id,
+        # and subsystem-id if found
+        d_keys = tuple(self._normalize_pci_id(device_dict.get(key)) for key in self.pci_device_keys)
         if any(k is None for k in d_keys[:2]):
             # vendor and device ids are required
             return device_name
         # - check our system_profiler info
         if not isinstance(pci_devices,list):
             pci_devices = self.get_pci_devices(force=force)
-        for pci_device in pci_devices:
-            p_keys = [normalize_id(pci_device.get("sppci_"+key)) for key in key_list]
-            if p_keys == d_keys:
-                # Got a match - save the name if present
-                device_name = pci_device.get("_name",device_name)
-                break
+        pci_device = self._get_pci_devices_index(pci_devices).get(d_keys)
+        if pci_device is not None:
+            # Got a match - save the name if present
+            device_name = pci_device.get("_name",device_name)
         return device_name
 
+    def _normalize_pci_id(self, _id):
+        # Returns the int value of an ioreg <data> or hex string id
+        if not _id:
+            return None
+        if _id.startswith("<") and _id.endswith(">"):
+            _id = _id.strip("<>")
+            try:
+                _id = binascii.hexlify(binascii.unhexlify(_id)[::-1]).decode()
+            except:
+                return None
+        try:
+            return int(_id,16)
+        except:
+            return None
+
+    def _get_pci_devices_index(self, pci_devices):
+        # Maps the normalized ids of each system_profiler entry to the
+        # first entry that has them - only rebuilt when passed a
+        # different list.  The system_profiler output prefixes the
+        # keys with "sppci_"
+        index = self.pci_devices_index
+        if index and index["source"] is pci_devices:
+            return index["devices"]
+        devices = {}
+        for pci_device in pci_devices:
+            p_keys = tuple(self._normalize_pci_id(pci_device.get("sppci_"+key)) for key in self.pci_device_keys)
+            if any(k is None for k in p_keys[:2]):
+                continue # Can't match anything without these
+            devices.setdefault(p_keys,pci_device)
+        self.pci_devices_index = {"source":pci_devices,"devices":devices}
+        return devices
+
     def get_all_devices(self, plane=None, force=False):
         # Let's build a device dict - and retain any info for each
         if plane is None:
@@ -356,127 +1110,101 @@ class IOReg:
                 plane = "IODeviceTree"
             else:
                 plane = "IOService"
-        self.get_ioreg(plane=plane,force=force)
+        tree = self.get_ioreg_tree(plane=plane,force=force)
+        lines = tree["lines"]
         # We're only interested in these two classes
         class_match = (
-            "<class IOPCIDevice,",
-            "<class IOACPIPlatformDevice,"
+            "IOPCIDevice",
+            "IOACPIPlatformDevice"
         )
         # Set up some preliminary placeholders
         path_list = {}
         _path = []
-        dev_primed = False
-        curr_dev = {}
-        # Walk the ioreg lines and keep track of the last
+        # Walk the ioreg nodes and keep track of the last
         # valid class, indentation, etc
-        for line in self.ioreg[plane]:
-            if not dev_primed:
-                # We're not looking within a device already
-                # Only prime on devices
-                if not "+-o " in line:
-                    continue # Not a class entry
-                # Ensure we're keeping track of scope
-                parts = line.split("+-o ")
-                pad = len(parts[0])
-                while len(_path):
-                    # Remove any path entries that are nested
-                    # equal to or further than our current set
-                    if _path[-1][-1] >= pad:
-                        del _path[-1]
-                    else:
-                        break
-                if class_match and not any(c in line for c in class_match):
-                    continue # Not the right class
-                # We found a device of our class - let's
-                # retain info about it
-                name = parts[1].split("  ")[0]
-                clss = parts[1].split("<class ")[1].split(",")[0]
-                # Get the decimal address in X,Y format
-                a = self._get_dec_addr(name)
-                outs = a.split("@")[1].split(",")
-                d = outs[0].upper()
-                f = 0 if len(outs) == 1 else outs[1].upper()
-                # Format as the device path
-                dev_path = "Pci(0x{},0x{})".format(d,f)
-                _path.append([
-                    dev_path,
-                    parts[1].split("  ")[0],
-                    parts[1].split("<class ")[1].split(",")[0],
-                    line,
-                    pad
-                ])
-                # Prime our device walker
-                dev_primed = True
-            else:
-                # We'd wait until we get a lone closing curly brace
-                # to denote the end of a device scope here
-                if line.replace("|","").strip() == "}":
-                    # Closed - check what kind of device we got
-                    dev_primed = False
-                    # Retain the curr_dev as a local var
-                    # and reset
-                    this_dev = curr_dev
-                    curr_dev = {}
-                    # PCI roots should use PNP0A03 or PNP0A08 in either
-                    # name or compatible
-                    if any(p in this_dev.get("compatible","")+this_dev.get("name","") for p in ("PNP0A03","PNP0A08")):
-                        # Got one - we need to change the type in the last _path entry
-                        # and we need to get the _UID
-                        try:
-                            _uid = int(this_dev.get("_UID","0").strip('"'))
-                        except:
-                            _uid = 0 # Fall back on zero
-                        # Update the device path
-                        _path[-1][0] = "PciRoot(0x{})".format(hex(_uid)[2:].upper())
-                        # Ensure this is top-level.  Reset if needed.
-                        # This can help prevent things like _SB taking priority
-                        # in the IOACPIPlane
-                        _path = [_path[-1]]
-                    elif _path[-1][2] == "IOACPIPlatformDevice":
-                        # Got an ACPI device that's not a PciRoot - skip
-                        continue
-                    elif len(_path) == 1:
-                        # Got a lone path that's not a PciRoot()
-                        # Skip it to avoid things like CPU objects being added
-                        continue
-                    # Get our full device path
-                    dev_path = "/".join([x[0] for x in _path])
-                    # Add a new entry to our path list
-                    if dev_path in path_list or not dev_path.startswith("PciRoot("):
-                        # Skip - either a duplicate (shouldn't happen), or
-                        # it lacks a PciRoot
-                        continue
-                    # Get our parent's acpi path + ours
-                    acpi_path = None
-                    if not "/" in dev_path:
-                        # We're the PCI root - just save our path
-                        # preceeded by /
-                        acpi_path = "/{}".format(_path[-1][1])
-                    else:
-                        # We should have a parent - get their dev path
-                        parent_dev_path = "/".join(dev_path.split("/")[:-1])
-                        parent_acpi_path = path_list.get(parent_dev_path,{}).get("acpi_path",None)
-                        if parent_acpi_path is not None:
-                            # We got something - append our path
-                            acpi_path = "{}/{}".format(parent_acpi_path,_path[-1][1])
-                    path_list[dev_path] = {
-                        "device_path":dev_path,
-                        "info":this_dev,
-                        "segment":_path[-1][0],
-                        "name":_path[-1][1],
-                        "name_no_addr":_path[-1][1].split("@")[0],
-                        "addr": "0" if not "@" in _path[-1][1] else _path[-1][1].split("@")[-1],
-                        "type":_path[-1][2],
-                        "acpi_path":acpi_path,
-                        "line":_path[-1][3]
-                    }
-                    continue
-                # We're walking scope here - try to retain info
+        for node in tree["nodes"]:
+            # Ensure we're keeping track of scope
+            pad = node.pad
+            while len(_path):
+                # Remove any path entries that are nested
+                # equal to or further than our current set
+                if _path[-1][-1] >= pad:
+                    del _path[-1]
+                else:
+                    break
+            if not node.clss in class_match:
+                continue # Not the right class
+            # We found a device of our class - let's
+            # retain info about it
+            # Get the decimal address in X,Y format
+            a = self._get_dec_addr(node.name)
+            outs = a.split("@")[1].split(",")
+            d = outs[0].upper()
+            f = 0 if len(outs) == 1 else outs[1].upper()
+            # Format as the device path
+            dev_path = "Pci(0x{},0x{})".format(d,f)
+            _path.append([
+                dev_path,
+                node.name,
+                node.clss,
+                lines[node.line],
+                pad
+            ])
+            # Gather the properties from the device's scope
+            this_dev = self._get_node_props(tree,node)
+            # PCI roots should use PNP0A03 or PNP0A08 in either
+            # name or compatible
+            if any(p in this_dev.get("compatible","")+this_dev.get("name","") for p in ("PNP0A03","PNP0A08")):
+                # Got one - we need to change the type in the last _path entry
+                # and we need to get the _UID
                 try:
-                    name = line.split(" = ")[0].split('"')[1]
-                    curr_dev[name] = line.split(" = ")[1]
-                except Exception as e:
-                    pass
+                    _uid = int(this_dev.get("_UID","0").strip('"'))
+                except:
+                    _uid = 0 # Fall back on zero
+                # Update the device path
+                _path[-1][0] = "PciRoot(0x{})".format(hex(_uid)[2:].upper())
+                # Ensure this is top-level.  Reset if needed.
+                # This can help prevent things like _SB taking priority
+                # in the IOACPIPlane
+                _path = [_path[-1]]
+            elif _path[-1][2] == "IOACPIPlatformDevice":
+                # Got an ACPI device that's not a PciRoot - skip
+                continue
+            elif len(_path) == 1:
+                # Got a lone path that's not a PciRoot()
+                # Skip it to avoid things like CPU objects being added
+                continue
+            # Get our full device path
+            dev_path = "/".join([x[0] for x in _path])
+            # Add a new entry to our path list
+            if dev_path in path_list or not dev_path.startswith("PciRoot("):
+                # Skip - either a duplicate (shouldn't happen), or
+                # it lacks a PciRoot
+                continue
+            # Get our parent's acpi path + ours
+            acpi_path = None
+            if not "/" in dev_path:
+                # We're the PCI root - just save our path
+                # preceeded by /
+                acpi_path = "/{}".format(_path[-1][1])
+            else:
+                # We should have a parent - get their dev path
+                parent_dev_path = "/".join(dev_path.split("/")[:-1])
+                parent_acpi_path = path_list.get(parent_dev_path,{}).get("acpi_path",None)
+                if parent_acpi_path is not None:
+                    # We got something - append our path
+                    acpi_path = "{}/{}".format(parent_acpi_path,_path[-1][1])
+            path_list[dev_path] = {
+                "device_path":dev_path,
+                "info":this_dev,
+                "segment":_path[-1][0],
+                "name":_path[-1][1],
+                "name_no_addr":_path[-1][1].split("@")[0],
+                "addr": "0" if not "@" in _path[-1][1] else _path[-1][1].split("@")[-1],
+                "type":_path[-1][2],
+                "acpi_path":acpi_path,
+                "line":_path[-1][3]
+            }
         return path_list
 
     def get_devices(self, dev_list=None, plane="IOService", force=False):
@@ -486,52 +1214,25 @@ class IOReg:
             return []
         if not isinstance(dev_list, list):
             dev_list = [dev_list]
-        self.get_ioreg(plane=plane,force=force)
-        dev = []
-        for line in self.ioreg[plane]:
-            if any(x for x in dev_list if x in line) and "+-o" in line:
-                dev.append(line.split("+-o ")[1].split("  ")[0])
-        return dev
+        tree = self.get_ioreg_tree(plane=plane,force=force)
+        found = set()
+        for x in dev_list:
+            if x: found.update(self._find_nodes(tree,x))
+        return [n.name for n in sorted(found,key=lambda n:n.index)]
 
     def get_device_info(self, dev_search=None, isclass=False, parent=None, plane="IOService", force=False):
         # Returns a list of all matched classes and their properties
         if not dev_search:
             return []
-        self.get_ioreg(plane=plane,force=force)
+        tree = self.get_ioreg_tree(plane=plane,force=force)
         dev = []
-        primed = False
-        current = None
-        path = []
         search = dev_search if not isclass else "<class " + dev_search
-        for line in self.ioreg[plane]:
-            if "<class " in line:
-                # Add each class entry to our path
-                path.append(line)
-            if not primed and not search in line:
-                continue
+        for node in self._find_nodes(tree,search):
             # Should have a device - let's see if we need to check a parent
-            if parent and not parent in self._walk_path(path):
+            if parent and not parent in self._get_node_acpi_path(node):
                 # Need a parent, and we don't have it - keep going
                 continue
-            if not primed:
-                primed = True
-                current = {"name":dev_search,"parts":{}}
-                continue
-            # Primed, but not our device
-            if "+-o" in line:
-                # Past our prime - see if we have a current, save
-                # it to the list, and clear it
-                primed = False
-                if current:
-                    dev.append(current)
-                    current = None
-                continue
-            # Primed, not class, not next device - must be info
-            try:
-                name = line.split(" = ")[0].split('"')[1]
-                current["parts"][name] = line.split(" = ")[1]
-            except Exception as e:
-                pass
+            dev.append({"name":dev_search,"parts":self._get_node_props(tree,node)})
         return dev
 
     def _walk_path(self,path,classes=("IOPCIDevice","IOACPIPlatformDevice")):
@@ -568,24 +1269,18 @@ class IOReg:
     def get_acpi_path(self, device, parent=None, plane="IOService", force=False):
         if not device:
             return ""
-        self.get_ioreg(plane=plane,force=force)
-        path = []
-        found = False
-        # First we find our device if it exists - and save each step
-        for x in self.ioreg[plane]:
-            if "<class " in x:
-                path.append(x)
-                if device in x:
-                    # Got our device - get the path walked
-                    test = self._walk_path(path)
-                    if parent:
-                        # Verify we have the parent in the path
-                        if parent in test:
-                            return test
-                        # Not in there - keep going
-                        continue
-                    # No parent check needed - return the test path
+        tree = self.get_ioreg_tree(plane=plane,force=force)
+        # Find our device if it exists - and get the path walked
+        for node in self._find_nodes(tree,device,lazy=True):
+            test = self._get_node_acpi_path(node)
+            if parent:
+                # Verify we have the parent in the path
+                if parent in test:
                     return test
+                # Not in there - keep going
+                continue
+            # No parent check needed - return the test path
+            return test
         # Didn't find anything
         return ""
 
@@ -603,7 +1298,7 @@ class IOReg:
         for x in out:
             if not len(dev_path):
                 # First entry - assume a PCI Root
-                _uid = self._get_pcix_uid(x)
+                _uid = self._get_pcix_uid(x,plane=plane)
                 if _uid is None:
                     # Broken path
                     return ""
@@ -288,6 +288,9 @@ _BINARY_FORMAT = {1: 'B', 2: 'H', 4: 'L', 8: 'Q'}
 
 _undefined = object()
 
+# Resolved once - looking it up per object slows down large binary plists
+_plistlib_data = getattr(plistlib, "Data", None)
+
 class _BinaryPlistParser:
     """
     Read or write a binary plist file, following the description of the binary
@@ -403,10 +406,10 @@ class _BinaryPlistParser:
 
         elif tokenH == 0x40:  # data
             s = self._get_size(tokenL)
-            if self._use_builtin_types or not hasattr(plistlib, "Data"):
+            if self._use_builtin_types or _plistlib_data is None:
                 result = self._fp.read(s)
             else:
-                result = plistlib.Data(self._fp.read(s))
+                result = _plistlib_data(self._fp.read(s))
 
         elif tokenH == 0x50:  # ascii string
             s = self._get_size(tokenL)
@@ -442,7 +445,7 @@ class _BinaryPlistParser:
             self._objects[ref] = result
             for k, o in zip(key_refs, obj_refs):
                 key = self._read_object(k)
-                if hasattr(plistlib, "Data") and isinstance(key, plistlib.Data):
+                if _plistlib_data is not None and isinstance(key, _plistlib_data):
                     key = key.data
                 result[key] = self._read_object(o)
 
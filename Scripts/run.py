@@ -1,77 +1,114 @@
-import sys, subprocess, time, threading, shlex
+import sys, os, io, subprocess, threading, shlex, codecs, locale
 try:
-    from Queue import Queue, Empty
+    from Queue import Queue
 except:
-    from queue import Queue, Empty
+    from queue import Queue
+try:
+    import selectors
+except ImportError:
+    selectors = None
 
 ON_POSIX = 'posix' in sys.builtin_module_names
 
 class Run:
 
     def __init__(self):
+        # Max number of bytes read from a pipe at once when streaming
+        self.chunk_size = 65536
         return
 
     def _read_output(self, pipe, q):
+        # Reads whatever is available from the pipe in chunks and tags
+        # each with the pipe it came from - None denotes the end.  The
+        # pipe is closed once it's done.
         try:
-            for line in iter(lambda: pipe.read(1), b''):
-                q.put(line)
-        except ValueError:
-            pass
-        pipe.close()
+            try:
+                for chunk in iter(lambda: os.read(pipe.fileno(), self.chunk_size), b''):
+                    q.put((pipe, chunk))
+            except (OSError, ValueError):
+                pass
+            q.put((pipe, None))
+        finally:
+            pipe.close()
 
-    def _create_thread(self, output):
-        # Creates a new queue and thread object to watch based on the output pipe sent
-        q = Queue()
+    def _create_thread(self, output, q):
+        # Creates a new thread object to watch the output pipe sent - feeding the passed queue
         t = threading.Thread(target=self._read_output, args=(output, q))
         t.daemon = True
-        return (q,t)
+        return t
+
+    def _iter_output(self, p):
+        # Yields (pipe, chunk) tuples from the process' stdout and stderr
+        # as soon as data is available, with a None chunk when each closes
+        pipes = [p.stdout, p.stderr]
+        if selectors is not None and ON_POSIX:
+            # Wait on both pipes at once - no threads or polling needed
+            sel = selectors.DefaultSelector()
+            for pipe in pipes:
+                sel.register(pipe, selectors.EVENT_READ)
+            try:
+                while sel.get_map():
+                    for key, _ in sel.select():
+                        chunk = os.read(key.fd, self.chunk_size)
+                        if not chunk:
+                            sel.unregister(key.fileobj)
+                            chunk = None
+                        yield (key.fileobj, chunk)
+            finally:
+                sel.close()
+            return
+        # Windows can't select() on pipes - use blocking reader threads
+        # feeding a single queue instead
+        q = Queue()
+        for pipe in pipes:
+            self._create_thread(pipe, q).start()
+        remaining = len(pipes)
+        while remaining:
+            pipe, chunk = q.get()
+            if chunk is None:
+                remaining -= 1
+            yield (pipe, chunk)
+
+    def _get_decoder(self):
+        # Mirrors universal_newlines=True - the locale's encoding with
+        # \r\n and \r translated to \n
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="ignore")
+        return io.IncrementalNewlineDecoder(decoder, translate=True)
 
     def _stream_output(self, comm, shell = False):
-        output = error = ""
+        output = []
+        error = []
         p = None
         try:
             if shell and type(comm) is list:
                 comm = " ".join(shlex.quote(x) for x in comm)
             if not shell and type(comm) is str:
                 comm = shlex.split(comm)
-            p = subprocess.Popen(comm, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, universal_newlines=True, close_fds=ON_POSIX)
-            # Setup the stdout thread/queue
-            q,t   = self._create_thread(p.stdout)
-            qe,te = self._create_thread(p.stderr)
-            # Start both threads
-            t.start()
-            te.start()
-
-            while True:
-                c = z = ""
-                try: c = q.get_nowait()
-                except Empty: pass
+            p = subprocess.Popen(comm, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, close_fds=ON_POSIX)
+            # Keep track of where each pipe echoes to, how it's decoded,
+            # and what it has gathered so far
+            streams = {
+                p.stdout: (sys.stdout, self._get_decoder(), output),
+                p.stderr: (sys.stderr, self._get_decoder(), error)
+            }
+            for pipe, chunk in self._iter_output(p):
+                out, decoder, gathered = streams[pipe]
+                if chunk is None:
+                    c = decoder.decode(b"", final=True)
                 else:
-                    sys.stdout.write(c)
-                    output += c
-                    sys.stdout.flush()
-                try: z = qe.get_nowait()
-                except Empty: pass
-                else:
-                    sys.stderr.write(z)
-                    error += z
-                    sys.stderr.flush()
-                if not c==z=="": continue # Keep going until empty
-                # No output - see if still running
-                p.poll()
-                if p.returncode != None:
-                    # Subprocess ended
-                    break
-                # No output, but subprocess still running - stall for 20ms
-                time.sleep(0.02)
-
-            o, e = p.communicate()
-            return (output+o, error+e, p.returncode)
+                    c = decoder.decode(chunk)
+                if not c:
+                    continue
+                out.write(c)
+                out.flush()
+                gathered.append(c)
+            p.wait()
+            return ("".join(output), "".join(error), p.returncode)
         except:
             if p:
                 try: o, e = p.communicate()
                 except: o = e = ""
-                return (output+o, error+e, p.returncode)
+                return ("".join(output)+self._decode(o), "".join(error)+self._decode(e), p.returncode)
             return ("", "Command not found!", 1)
 
     def _decode(self, value, encoding="utf-8", errors="ignore"):
@@ -94,57 +131,109 @@ class Run:
                 return ("", "Command not found!", 1)
         return (self._decode(c[0]), self._decode(c[1]), p.returncode)
 
-    def run(self, command_list, leave_on_fail = False):
+    def _prepare_command(self, comm):
+        # Prints any message, resolves sudo, and returns the
+        # (args, shell, stream, stdout, stderr) to run - or None if
+        # there's nothing to process
+        args   = comm.get("args",   [])
+        shell  = comm.get("shell",  False)
+        stream = comm.get("stream", False)
+        sudo   = comm.get("sudo",   False)
+        stdout = comm.get("stdout", False)
+        stderr = comm.get("stderr", False)
+        mess   = comm.get("message", None)
+        show   = comm.get("show",   False)
+        
+        if not mess == None:
+            print(mess)
+
+        if not len(args):
+            # nothing to process
+            return None
+        if sudo:
+            # Check if we have sudo
+            out = self._run_command(["which", "sudo"])
+            if "sudo" in out[0]:
+                # Can sudo
+                if type(args) is list:
+                    args.insert(0, out[0].replace("\n", "")) # add to start of list
+                elif type(args) is str:
+                    args = out[0].replace("\n", "") + " " + args # add to start of string
+        
+        if show:
+            print(" ".join(args))
+        return (args, shell, stream, stdout, stderr)
+
+    def _run_prepared(self, prepared):
+        args, shell, stream, stdout, stderr = prepared
+        if stream:
+            # Stream it!
+            return self._stream_output(args, shell)
+        # Just run and gather output
+        out = self._run_command(args, shell)
+        if stdout and len(out[0]):
+            print(out[0])
+        if stderr and len(out[1]):
+            print(out[1])
+        return out
+
+    def _run_concurrent(self, prepared_list, leave_on_fail = False, max_workers = 4):
+        # Runs the prepared commands on up to max_workers threads - handing
+        # them out in order.  Results are returned in input order.  If
+        # leave_on_fail is set, each worker checks for a failure before
+        # starting its next command, so nothing past a failure is started
+        # once it's known.  Commands other workers already started while
+        # the failing one ran still finish, but only the results up to and
+        # including the first failure are returned.
+        results = [None]*len(prepared_list)
+        lock = threading.Lock()
+        state = {"next":0, "failed":None}
+        def worker():
+            while True:
+                with lock:
+                    i = state["next"]
+                    if i >= len(prepared_list) or (state["failed"] is not None and i > state["failed"]):
+                        return
+                    state["next"] += 1
+                out = self._run_prepared(prepared_list[i])
+                with lock:
+                    results[i] = out
+                    if leave_on_fail and out[2] != 0 and (state["failed"] is None or i < state["failed"]):
+                        state["failed"] = i
+        threads = []
+        for _ in range(max(1, min(max_workers, len(prepared_list)))):
+            t = threading.Thread(target=worker)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        if state["failed"] is not None:
+            results = results[:state["failed"]+1]
+        return results
+
+    def run(self, command_list, leave_on_fail = False, concurrent = False, max_workers = 4):
         # Command list should be an array of dicts
         if type(command_list) is dict:
             # We only have one command
             command_list = [command_list]
         output_list = []
-        for comm in command_list:
-            args   = comm.get("args",   [])
-            shell  = comm.get("shell",  False)
-            stream = comm.get("stream", False)
-            sudo   = comm.get("sudo",   False)
-            stdout = comm.get("stdout", False)
-            stderr = comm.get("stderr", False)
-            mess   = comm.get("message", None)
-            show   = comm.get("show",   False)
-            
-            if not mess == None:
-                print(mess)
-
-            if not len(args):
-                # nothing to process
-                continue
-            if sudo:
-                # Check if we have sudo
-                out = self._run_command(["which", "sudo"])
-                if "sudo" in out[0]:
-                    # Can sudo
-                    if type(args) is list:
-                        args.insert(0, out[0].replace("\n", "")) # add to start of list
-                    elif type(args) is str:
-                        args = out[0].replace("\n", "") + " " + args # add to start of string
-            
-            if show:
-                print(" ".join(args))
-
-            if stream:
-                # Stream it!
-                out = self._stream_output(args, shell)
-            else:
-                # Just run and gather output
-                out = self._run_command(args, shell)
-                if stdout and len(out[0]):
-                    print(out[0])
-                if stderr and len(out[1]):
-                    print(out[1])
-            # Append output
-            output_list.append(out)
-            # Check for errors
-            if leave_on_fail and out[2] != 0:
-                # Got an error - leave
-                break
+        if concurrent and len(command_list) > 1:
+            # Run them all at once with a bounded number of workers
+            prepared_list = [x for x in map(self._prepare_command, command_list) if x]
+            output_list = self._run_concurrent(prepared_list, leave_on_fail, max_workers)
+        else:
+            for comm in command_list:
+                prepared = self._prepare_command(comm)
+                if not prepared:
+                    continue
+                out = self._run_prepared(prepared)
+                # Append output
+                output_list.append(out)
+                # Check for errors
+                if leave_on_fail and out[2] != 0:
+                    # Got an error - leave
+                    break
         if len(output_list) == 1:
             # We only ran one command - just return that output
             return output_list[0]
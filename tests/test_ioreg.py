@@ -0,0 +1,143 @@
+import os, sys, gzip, shutil, tempfile, time, unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0,ROOT)
+from Scripts import ioreg
+
+# A trimmed ioreg -lw0 dump.  The acpi-path properties mention the names
+# of their parents, and IOResources is the last node in the plane.
+IOREG_DUMP = """+-o Root  <class IORegistryEntry, id 0x1, retain 10>
+| {
+| }
+|
+| +-o PC00@0  <class IOACPIPlatformDevice, id 0x2, retain 10>
+| | {
+| |   "compatible" = <"PNP0A03">
+| |   "_UID" = "0"
+| | }
+| |
+| | +-o RP1@1C  <class IOPCIDevice, id 0x3, retain 10>
+| | | {
+| | |   "acpi-path" = "IOACPIPlane:/_SB/PC00@0/RP1@1c0000"
+| | |   "pcidebug" = "0:28:0"
+| | | }
+| | |
+| | +-o RP10@1D  <class IOPCIDevice, id 0x4, retain 10>
+| |   {
+| |     "acpi-path" = "IOACPIPlane:/_SB/PC00@0/RP10@1d0000"
+| |     "pcidebug" = "0:29:0"
+| |   }
+| |
+| +-o PC01@1  <class IOACPIPlatformDevice, id 0x5, retain 10>
+|   {
+|     "compatible" = <"PNP0A08">
+|     "_UID" = "1"
+|   }
+|
+|   +-o RP02@1  <class IOPCIDevice, id 0x6, retain 10>
+|     {
+|       "acpi-path" = "IOACPIPlane:/_SB/PC01@1/RP02@10000"
+|       "pcidebug" = "1:1:0"
+|     }
+|
++-o IOResources  <class IOResources, id 0x7, retain 10>
+    {
+      "IOKit" = "IOService"
+    }
+"""
+
+class IORegTestCase(unittest.TestCase):
+    def setUp(self):
+        self.i = ioreg.IOReg()
+        self.i.ioreg["IOService"] = IOREG_DUMP.split("\n")
+
+class TestFindNodes(IORegTestCase):
+    # Searches match node headers only - see get_device_info() below for
+    # how that differs from the original line scan
+
+    def test_get_devices_keeps_substring_matches(self):
+        self.assertEqual(self.i.get_devices("RP1"),["RP1@1C","RP10@1D"])
+        self.assertEqual(self.i.get_devices("RP10"),["RP10@1D"])
+        self.assertEqual(self.i.get_devices(["RP02","PC01"]),["PC01@1","RP02@1"])
+
+    def test_get_device_info_ignores_property_values(self):
+        # The original scan also matched the acpi-path lines of PC00@0's
+        # children, returning an entry for each
+        info = self.i.get_device_info("PC00@0")
+        self.assertEqual(len(info),1)
+        self.assertEqual(info[0]["parts"]["_UID"],'"0"')
+
+    def test_get_device_info_includes_last_node(self):
+        # The original scan only saved an entry once the next node's
+        # header showed up, so the last node was never returned
+        info = self.i.get_device_info("IOResources")
+        self.assertEqual(len(info),1)
+        self.assertEqual(info[0]["parts"],{"IOKit":'"IOService"'})
+
+    def test_get_device_info_by_class(self):
+        info = self.i.get_device_info("IOPCIDevice",isclass=True)
+        self.assertEqual([x["parts"]["pcidebug"] for x in info],['"0:28:0"','"0:29:0"','"1:1:0"'])
+
+    def test_repeat_and_missing_searches(self):
+        self.assertEqual(self.i.get_acpi_path("RP1@1C"),"/PC00@0/RP1@1C0000")
+        self.assertEqual(self.i.get_acpi_path("RP1@1C"),"/PC00@0/RP1@1C0000")
+        self.assertEqual(self.i.get_acpi_path("RP1",parent="PC01"),"")
+        self.assertEqual(self.i.get_devices("nothere"),[])
+        self.assertEqual(self.i.get_device_info("nothere"),[])
+
+class TestPciRootUid(IORegTestCase):
+    def test_root_uid_at_nonzero_address(self):
+        # _walk_path() yields PC01@10000 for PC01@1 - the original lookup
+        # never matched that form and fell back to PciRoot(0x0)
+        self.assertEqual(self.i.get_device_path("RP02@1"),"PciRoot(0x1)/Pci(0x1,0x0)")
+        self.assertEqual(self.i._get_pcix_uid("PC01@10000"),1)
+        self.assertEqual(self.i._get_pcix_uid("PC01@1"),1)
+
+    def test_root_uid_at_zero_address(self):
+        self.assertEqual(self.i.get_device_path("RP1@1C"),"PciRoot(0x0)/Pci(0x1C,0x0)")
+
+    def test_missing_root_uid(self):
+        self.assertEqual(self.i._get_pcix_uid("PC09@0"),0)
+        self.assertIsNone(self.i._get_pcix_uid("PC09@0",allow_fallback=False))
+
+PCI_IDS = """# Trimmed pci.ids
+8086  Intel Corporation
+\t1234  Test Device
+C 03  Display controller
+"""
+
+class TestPciIdsLazy(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.i = ioreg.IOReg()
+        self.i.pci_ids_lazy = True
+        self.i.pci_ids_path = os.path.join(self.temp,"pci.ids")
+        self.i.pci_ids_cache_path = self.i.pci_ids_path+".cache"
+        self.i.pci_ids_index_path = self.i.pci_ids_path+".index"
+        self.i.pci_ids_expanded_path = self.i.pci_ids_path+".expanded"
+
+    def tearDown(self):
+        shutil.rmtree(self.temp,ignore_errors=True)
+
+    def test_gz_is_expanded_beside_a_local_pci_ids(self):
+        with open(self.i.pci_ids_path,"w") as f:
+            f.write("# Hand placed\n")
+        # Make sure the .gz is the newer of the two
+        time.sleep(0.01)
+        with gzip.open(self.i.pci_ids_path+".gz","wt") as f:
+            f.write(PCI_IDS)
+        info = self.i.get_device_info_from_pci_ids({"vendor-id":"<86800000>","device-id":"<34120000>"})
+        self.assertEqual(info.get("device"),"Test Device")
+        with open(self.i.pci_ids_path) as f:
+            self.assertEqual(f.read(),"# Hand placed\n")
+        self.assertTrue(os.path.isfile(self.i.pci_ids_expanded_path))
+
+    def test_local_pci_ids_is_used_without_a_gz(self):
+        with open(self.i.pci_ids_path,"w") as f:
+            f.write(PCI_IDS)
+        info = self.i.get_device_info_from_pci_ids({"vendor-id":"<86800000>","device-id":"<34120000>"})
+        self.assertEqual(info.get("device"),"Test Device")
+        self.assertFalse(os.path.exists(self.i.pci_ids_expanded_path))
+
+if __name__ == '__main__':
+    unittest.main()